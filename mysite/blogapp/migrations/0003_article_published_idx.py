@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogapp', '0002_article_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('published_at__isnull', False)), fields=['-published_at'], name='blogapp_article_published_idx'),
+        ),
+    ]
@@ -1,6 +1,18 @@
 from django.db import models
+from django.db.models.functions import Substr
 from django.urls import reverse
 
+EXCERPT_LENGTH = 200
+
+
+class ArticleQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(published_at__isnull=False).order_by('-published_at')
+
+    def with_excerpt(self, length: int = EXCERPT_LENGTH):
+        # Начало текста режется в базе, сам body в Python не читается.
+        return self.defer('body').annotate(excerpt=Substr('body', 1, length))
+
 
 # Create your models here.
 
@@ -8,6 +20,20 @@ class Article(models.Model):
     title = models.CharField(max_length=100)
     body = models.TextField(null=True, blank=True)
     published_at = models.DateTimeField(null=True, blank=True)
+    # Входит в ключ кэша карточки статьи в шаблоне.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ArticleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Список и лента: только опубликованные, новые первыми.
+            models.Index(
+                fields=['-published_at'],
+                condition=models.Q(published_at__isnull=False),
+                name='blogapp_article_published_idx',
+            ),
+        ]
 
     def get_absolute_url(self):
         return reverse("blogapp:article", kwargs={"pk": self.pk})
@@ -1,14 +1,11 @@
-from django.contrib.sitemaps import Sitemap
+from mysite.sitemap_cache import CachedSitemap
 
 from .models import Article
 
 
-class BlogSitemap(Sitemap):
+class BlogSitemap(CachedSitemap):
     changefreq = 'never'
     priority = 0.5
 
-    def items(self):
-        return Article.objects.filter(published_at__isnull=False).order_by('-published_at')
-
-    def lastmod(self, obj):
-        return obj.published_at
\ No newline at end of file
+    def get_queryset(self):
+        return Article.objects.filter(published_at__isnull=False)
@@ -1,3 +1,74 @@
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from blogapp.models import Article
+from requestdataapp.querycheck import query_budget
+
+
+class LatestArticlesFeedTestCase(TestCase):
+    def setUp(self) -> None:
+        now = timezone.now()
+        for day in range(7):
+            Article.objects.create(
+                title=f'Article {day}',
+                body='Lorem ipsum ' * 50,
+                published_at=now - timedelta(days=day),
+            )
+        Article.objects.create(title='Draft', body='Not yet')
+        cache.clear()
+
+    async def test_feed_lists_latest_published_articles(self):
+        response = await self.async_client.get(
+            reverse('blogapp:articles-feed'),
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertEqual(content.count('<item>'), 5)
+        self.assertIn('Article 0', content)
+        self.assertNotIn('Draft', content)
+        self.assertIn('Lorem ipsum ' * 16 + 'Lorem ip</description>', content)
+
+    async def test_feed_is_cached_and_revalidated(self):
+        url = reverse('blogapp:articles-feed')
+        response = await self.async_client.get(url)
+        etag = response['ETag']
+
+        with query_budget(1):
+            cached = await self.async_client.get(url)
+        with query_budget(1):
+            not_modified = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+
+        article = await Article.objects.published().afirst()
+        article.title = 'Renamed'
+        await article.asave()
+        response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed')
+
+    def test_excerpt_is_cut_in_database(self):
+        article = Article.objects.with_excerpt(10).get(title='Article 0')
+        self.assertEqual(article.excerpt, 'Lorem ipsu')
+        self.assertNotIn('body', article.__dict__)
+
+
+class ArticleListViewTestCase(TestCase):
+    def setUp(self) -> None:
+        now = timezone.now()
+        Article.objects.bulk_create(
+            Article(title=f'Article {i}', body='Lorem ipsum', published_at=now - timedelta(hours=i))
+            for i in range(25)
+        )
 
-# Create your tests here.
+    def test_articles_are_paginated(self):
+        response = self.client.get(reverse('blogapp:articles'), {'page': 2})
+        articles = response.context['object_list']
+        self.assertEqual([article.title for article in articles], [f'Article {i}' for i in range(20, 25)])
+        self.assertNotIn('body', articles[0].__dict__)
+        self.assertContains(response, 'Page 2 of 2')
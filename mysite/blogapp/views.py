@@ -1,40 +1,89 @@
+from hashlib import md5
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
 from django.contrib.syndication.views import Feed
-from django.shortcuts import render
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
 from django.urls import reverse_lazy, reverse
+from django.utils.http import quote_etag
 from django.views.generic import ListView, DetailView
 
 from blogapp.models import Article
+from mysite.conditional import Validators, conditional_response, set_validators
+
+FEED_SIZE = 5
+FEED_CACHE_TIMEOUT = 24 * 60 * 60
 
 
 # Create your views here.
 class ArticleListView(ListView):
-    queryset = (
-        Article.objects
-        .filter(published_at__isnull=False)
-        .order_by('-published_at')
-    )
+    # Текст статьи в списке не выводится.
+    queryset = Article.objects.published().defer('body')
+    paginate_by = 20
 
 class ArticleDetailView(DetailView):
     model = Article
 
 
 class LatestArticlesFeed(Feed):
+    """
+    RSS последних статей. Статьи читаются через async ORM,
+    сама лента собирается уже из готового списка без запросов к базе.
+
+    Читатели опрашивают ленту каждые несколько минут, поэтому сначала
+    по индексу читаются только pk и updated_at последних статей: из них
+    получаются ETag и Last-Modified для условного GET и ключ кэша
+    готовой ленты. Статьи с текстом читаются, только если ленты нет в кэше.
+    """
     title = "Blog articles (latest)"
     description = "Updates on changes and addition blog articles"
     link = reverse_lazy("blogapp:articles")
 
-    def items(self):
-        return (
-            Article.objects
-            .filter(published_at__isnull=False)
-            .order_by('-published_at')[:5]
-        )
+    def __init__(self):
+        markcoroutinefunction(self)
+
+    def get_queryset(self):
+        return Article.objects.published().with_excerpt()[:FEED_SIZE]
+
+    async def get_validators(self, request: HttpRequest) -> Validators:
+        rows = [row async for row in Article.objects.published().values_list('pk', 'updated_at')[:FEED_SIZE]]
+        # Ссылки в ленте абсолютные, поэтому она зависит и от хоста.
+        raw = ':'.join((
+            request.scheme,
+            request.get_host(),
+            *(f'{pk}@{updated_at.isoformat()}' for pk, updated_at in rows),
+        ))
+        last_modified = max((updated_at for _, updated_at in rows), default=None)
+        return Validators(quote_etag(md5(raw.encode()).hexdigest()), last_modified, len(rows))
+
+    async def __call__(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        validators = await self.get_validators(request)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        key = 'blogapp:feed:' + validators.etag.strip('"')
+        content = await cache.aget(key)
+        if content is None:
+            articles = [article async for article in self.get_queryset()]
+            content = await sync_to_async(self.render_feed)(articles, request)
+            await cache.aset(key, content, FEED_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=self.feed_type.content_type)
+        return set_validators(response, validators)
+
+    def render_feed(self, articles: list[Article], request: HttpRequest) -> str:
+        # get_feed обращается к сайтам и reverse(), поэтому выполняется
+        # в потоке, а не в цикле событий.
+        return self.get_feed(articles, request).writeString('utf-8')
+
+    def items(self, articles: list[Article]):
+        return articles
 
     def item_title(self, item: Article):
         return item.title
 
     def item_description(self, item: Article):
-        return item.body[:200]
+        return item.excerpt or ''
 
     def item_link(self, item: Article):
         return reverse("blogapp:article", kwargs={"pk": item.pk})
@@ -0,0 +1,33 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .caching import AUTH_CACHE_TIMEOUT, permissions_cache_key, user_cache_key
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ``ModelBackend``, который берет пользователя из сессии и его права
+    из кэша, а не из базы на каждый запрос.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, AUTH_CACHE_TIMEOUT)
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return super().get_all_permissions(user_obj, obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, AUTH_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
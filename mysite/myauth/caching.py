@@ -0,0 +1,65 @@
+"""
+Кэш пользователей и их прав для проверок доступа.
+
+Строка пользователя и итоговый набор его прав (свои и групп) хранятся
+в кэше между запросами. Ключи версионированы, как у товаров: у каждого
+пользователя своя версия, она меняется при изменении самого пользователя,
+его групп и его прав. Общая версия меняется только при изменении групп
+и прав, которые затрагивают сразу многих пользователей. Версии всегда
+читаются из общего уровня кэша, поэтому изменение сразу видно всем
+воркерам.
+"""
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+
+AUTH_VERSION_PREFIX = 'myauth:version'
+GROUPS_VERSION_KEY = f'{AUTH_VERSION_PREFIX}:groups'
+AUTH_CACHE_TIMEOUT = 60 * 60
+
+
+def _user_version_key(user_id) -> str:
+    return f'{AUTH_VERSION_PREFIX}:user:{user_id}'
+
+
+def _get_versions(*keys: str) -> list[int]:
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Как и у товаров, начинаем с текущего времени, а не с 1.
+            cache.add(key, time_ns(), None)
+            versions[key] = cache.get(key, time_ns())
+    return [versions[key] for key in keys]
+
+
+def _bump_version(key: str) -> None:
+    # Как и у товаров, новая версия - время, а не incr: он не атомарен
+    # между воркерами.
+    cache.set(key, time_ns(), None)
+
+
+def _bump(key: str) -> None:
+    # Сразу - чтобы права не продолжали действовать до конца транзакции,
+    # и еще раз после коммита - чтобы другой воркер не успел закэшировать
+    # под новой версией данные, которые он еще видел до коммита.
+    _bump_version(key)
+    transaction.on_commit(lambda: _bump_version(key))
+
+
+def bump_user_version(user_id) -> None:
+    _bump(_user_version_key(user_id))
+
+
+def bump_groups_version() -> None:
+    _bump(GROUPS_VERSION_KEY)
+
+
+def user_cache_key(user_id) -> str:
+    version, = _get_versions(_user_version_key(user_id))
+    return f'myauth:user:{user_id}:v{version}'
+
+
+def permissions_cache_key(user_id) -> str:
+    user_version, groups_version = _get_versions(_user_version_key(user_id), GROUPS_VERSION_KEY)
+    return f'myauth:perms:{user_id}:v{user_version}:g{groups_version}'
@@ -0,0 +1,43 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations
+
+OLD_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+NEW_BACKEND = 'myauth.backends.CachedModelBackend'
+
+
+def move_sessions(apps, schema_editor, old=OLD_BACKEND, new=NEW_BACKEND):
+    """
+    Переписывает путь бэкенда в открытых сессиях, чтобы они остались
+    действительными без ``ModelBackend`` в AUTHENTICATION_BACKENDS.
+    Срок жизни сессий не меняется.
+    """
+    Session = apps.get_model('sessions', 'Session')
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+    for session in Session.objects.iterator():
+        store = SessionStore(session.session_key)
+        data = store.decode(session.session_data)
+        if data.get('_auth_user_backend') != old:
+            continue
+        data['_auth_user_backend'] = new
+        Session.objects.filter(pk=session.pk).update(session_data=store.encode(data))
+        # cached_db держит копию сессии в кэше.
+        if hasattr(store, 'cache_key'):
+            store._cache.delete(store.cache_key)
+
+
+def move_sessions_back(apps, schema_editor):
+    move_sessions(apps, schema_editor, old=NEW_BACKEND, new=OLD_BACKEND)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myauth', '0001_initial'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_sessions, move_sessions_back),
+    ]
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_groups_version, bump_user_version
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance: User, update_fields=None, **kwargs):
+    # Вход меняет только last_login: на проверки доступа это не влияет.
+    # Новых пользователей не пропускаем: pk может достаться от удаленного.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_user_version(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance: User, **kwargs):
+    bump_user_version(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def group_or_permission_deleted(sender, **kwargs):
+    # Связи с пользователями удаляются каскадом без m2m_changed.
+    bump_groups_version()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_relations_changed(sender, instance, action: str, reverse: bool, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_user_version(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) и т.п.: pk_set - затронутые пользователи.
+        for user_id in pk_set:
+            bump_user_version(user_id)
+    else:
+        # clear() со стороны группы или права не сообщает, кого затронул.
+        bump_groups_version()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action: str, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_groups_version()
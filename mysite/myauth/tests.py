@@ -1,7 +1,17 @@
+from importlib import import_module
+from unittest.mock import patch
+
+from django.apps import apps as django_apps
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 import json
 
+from myauth.backends import CachedModelBackend
+from requestdataapp.querycheck import query_budget
+
 
 # Create your tests here.
 class GetCookieViewTestCase(TestCase):
@@ -20,4 +30,71 @@ class FooBarViewTest(TestCase):
         expected_data = {'foo': 'bar', 'spam': 'eggs'}
         # recieved_data = json.loads(response.content)
         # self.assertEqual(recieved_data, expected_data)
-        self.assertJSONEqual(response.content, expected_data)
\ No newline at end of file
+        self.assertJSONEqual(response.content, expected_data)
+
+
+class CachedModelBackendTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.user = User.objects.create_user(username='bob_test', password='qwerty')
+        self.group = Group.objects.create(name='profile viewers')
+        self.user.groups.add(self.group)
+        self.permission = Permission.objects.get(codename='view_profile')
+
+    def fresh_user(self) -> User:
+        return self.backend.get_user(self.user.pk)
+
+    def test_hot_user_is_served_without_queries(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('myauth:session_get'))
+        self.fresh_user().has_perm('myauth.view_profile')
+        with query_budget(0):
+            self.assertContains(self.client.get(reverse('myauth:session_get')), 'Session value')
+            self.assertFalse(self.fresh_user().has_perm('myauth.view_profile'))
+
+    def test_group_permission_changes_invalidate_cache(self):
+        self.assertFalse(self.fresh_user().has_perm('myauth.view_profile'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm('myauth.view_profile'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.clear()
+        self.assertFalse(self.fresh_user().has_perm('myauth.view_profile'))
+
+    def test_deactivated_user_is_dropped(self):
+        self.assertIsNotNone(self.fresh_user())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(self.fresh_user())
+
+    def test_other_users_changes_keep_cache(self):
+        self.fresh_user().has_perm('myauth.view_profile')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='alice_test')
+            other = User.objects.create_user(username='carol_test')
+            other.first_name = 'Carol'
+            other.save()
+        with query_budget(0):
+            self.assertFalse(self.fresh_user().has_perm('myauth.view_profile'))
+
+    def test_sessions_of_model_backend_stay_valid(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('myauth:session_get'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+        migration = import_module('myauth.migrations.0002_cached_backend_sessions')
+        migration.move_sessions(django_apps, None)
+        response = self.client.get(reverse('myauth:session_get'))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_failed_login_checks_password_once(self):
+        with patch.object(User, 'check_password', autospec=True, return_value=False) as check_password:
+            self.assertIsNone(authenticate(username='bob_test', password='wrong'))
+        self.assertEqual(check_password.call_count, 1)
+
+        with patch.object(User, 'set_password', autospec=True) as set_password:
+            self.assertIsNone(authenticate(username='nobody', password='wrong'))
+        self.assertEqual(set_password.call_count, 1)
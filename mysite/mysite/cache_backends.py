@@ -0,0 +1,151 @@
+"""
+Двухуровневый кэш: маленький LRU в памяти процесса перед общим файловым кэшем.
+
+Файловый уровень общий для всех воркеров gunicorn на одной машине и не
+требует внешнего сервиса. Локальный уровень снимает чтение файлов с
+горячих ключей. Записи живут в локальном уровне не дольше LOCAL_TIMEOUT
+секунд: столько максимум воркер может видеть значение, уже измененное
+другим воркером. Ключи с префиксами из LOCAL_EXCLUDE_PREFIXES
+(счетчики версий и т.п.) всегда читаются из общего уровня.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'mysite.cache_backends.TwoTierCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+                'LOCAL_MAX_ENTRIES': 500,
+                'LOCAL_TIMEOUT': 5,
+                'LOCAL_EXCLUDE_PREFIXES': ['shopapp:products:version'],
+            },
+        },
+    }
+"""
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+_MISSING = object()
+
+
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._local_max_entries = int(options.pop('LOCAL_MAX_ENTRIES', 500))
+        self._local_timeout = float(options.pop('LOCAL_TIMEOUT', 5))
+        self._local_exclude_prefixes = tuple(options.pop('LOCAL_EXCLUDE_PREFIXES', ()))
+        params = {**params, 'OPTIONS': options}
+        super().__init__(params)
+        self._shared = FileBasedCache(location, params)
+        self._local = OrderedDict()
+        self._lock = Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'local_evictions': 0}
+
+    def _is_local(self, key) -> bool:
+        return not key.startswith(self._local_exclude_prefixes)
+
+    def _local_get(self, key):
+        local_key = self.make_and_validate_key(key)
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return None
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self._local[local_key]
+                return None
+            self._local.move_to_end(local_key)
+            self._stats['local_hits'] += 1
+        return pickled
+
+    def _local_set(self, key, value, timeout):
+        ttl = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        elif timeout is DEFAULT_TIMEOUT and self.default_timeout is not None:
+            ttl = min(ttl, self.default_timeout)
+        local_key = self.make_and_validate_key(key)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+                self._stats['local_evictions'] += 1
+
+    def _local_delete(self, key):
+        local_key = self.make_and_validate_key(key)
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    def get(self, key, default=None, version=None):
+        if version is not None:
+            return self._shared.get(key, default, version)
+        if self._is_local(key):
+            pickled = self._local_get(key)
+            if pickled is not None:
+                return pickle.loads(pickled)
+        value = self._shared.get(key, _MISSING)
+        if value is _MISSING:
+            with self._lock:
+                self._stats['misses'] += 1
+            return default
+        with self._lock:
+            self._stats['shared_hits'] += 1
+        if self._is_local(key):
+            self._local_set(key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._shared.set(key, value, timeout, version)
+        if version is None and self._is_local(key):
+            self._local_set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._shared.add(key, value, timeout, version)
+        if added and version is None and self._is_local(key):
+            self._local_set(key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(key)
+        return self._shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key)
+        return self._shared.delete(key, version)
+
+    def has_key(self, key, version=None):
+        if version is None and self._is_local(key) and self._local_get(key) is not None:
+            return True
+        return self._shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        # Как и у FileBasedCache, это чтение и запись без блокировки:
+        # два воркера могут получить одно и то же значение.
+        self._local_delete(key)
+        return self._shared.incr(key, delta, version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self._shared.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_entries'] = len(self._local)
+        return stats
+
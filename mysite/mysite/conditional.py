@@ -0,0 +1,48 @@
+"""
+Условные GET (ETag / Last-Modified) для страниц и API приложений.
+
+Представление считает ``Validators`` своим способом, обычно одним
+запросом без выборки самих данных, и отдает 304 через
+``conditional_response``, если версия у клиента актуальна. Иначе
+заголовки ставятся на готовый ответ через ``set_validators``.
+"""
+from datetime import datetime
+from typing import NamedTuple
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: datetime | None
+    count: int
+
+
+def _timestamp(validators: Validators) -> int | None:
+    if validators.last_modified is None:
+        return None
+    return int(validators.last_modified.timestamp())
+
+
+def set_validators(response: HttpResponse, validators: Validators) -> HttpResponse:
+    response['ETag'] = validators.etag
+    timestamp = _timestamp(validators)
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def conditional_response(request: HttpRequest, validators: Validators) -> HttpResponse | None:
+    """
+    304 (или 412), если версия у клиента актуальна, иначе ``None``.
+    """
+    headers = set_validators(HttpResponse(), validators)
+    response = get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=_timestamp(validators),
+        response=headers,
+    )
+    return None if response is headers else response
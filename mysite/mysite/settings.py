@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import sys
 from pathlib import Path
+from tempfile import gettempdir, mkdtemp
 from os import getenv
 from django.conf.global_settings import LOGIN_REDIRECT_URL, LOCALE_PATHS, LANGUAGES, LOGGING, CACHE_MIDDLEWARE_SECONDS
 from django.urls import reverse_lazy
@@ -91,6 +93,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.middlewares.RequestMetricsMiddleware',
+    'requestdataapp.querycheck.QueryInspectionMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -100,7 +104,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'requestdataapp.middlewares.set_useragent_on_request_middleware',
-    'requestdataapp.middlewares.CountRequestMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -113,7 +116,7 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
+        'APP_DIRS': False,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -121,11 +124,24 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Скомпилированные шаблоны хранятся в памяти процесса и не
+            # разбираются заново на каждый запрос. При DEBUG включаем
+            # обычные загрузчики, чтобы правки шаблонов подхватывались сразу.
+            'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ] if DEBUG else [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
+ASGI_APPLICATION = 'mysite.asgi.application'
 
 
 # Database
@@ -138,16 +154,62 @@ DATABASES = {
     }
 }
 
+TESTING = sys.argv[1:2] == ['test']
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-        # 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        # 'LOCATION': BASE_DIR / 'cache',
+        # 'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        'BACKEND': 'mysite.cache_backends.TwoTierCache',
+        'LOCATION': getenv('DJANGO_CACHE_DIR', BASE_DIR / 'cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'LOCAL_MAX_ENTRIES': 500,
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_EXCLUDE_PREFIXES': [
+                'shopapp:products:version',
+                'myauth:version',
+            ],
+        },
     }
 }
+if TESTING:
+    # Тесты не должны читать кэш, оставшийся от разработки или прошлых запусков.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 CACHE_MIDDLEWARE_SECONDS = 200
 
+# Адресов на одной странице карты сайта (протокол допускает до 50 000).
+SITEMAP_PAGE_SIZE = 10_000
+
+# Снимки метрик воркеров; каталог общий для всех воркеров gunicorn.
+METRICS_DIR = Path(getenv('DJANGO_METRICS_DIR', Path(gettempdir()) / 'mysite-metrics'))
+if TESTING:
+    # Тесты не должны попадать в метрики рабочих воркеров.
+    METRICS_DIR = Path(mkdtemp(prefix='mysite-metrics-test-'))
+METRICS_FLUSH_INTERVAL = 5
+# Откуда можно читать /metrics без входа персонала (Prometheus).
+METRICS_ALLOWED_IPS = getenv('DJANGO_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Поиск N+1: форма запроса, повторенная столько раз за запрос, - это N+1.
+# В тестах N+1 и превышение query_budget - ошибка, в проде - запись в лог.
+QUERY_INSPECTION = TESTING or DEBUG or getenv('DJANGO_QUERY_INSPECTION', '0') == '1'
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_BUDGET_RAISE = TESTING
+
+# Пользователь из сессии и его права берутся из кэша (myauth.caching).
+# Бэкенд один, иначе неудачный вход проверял бы пароль дважды; открытые
+# сессии ModelBackend переводит на него миграция myauth 0002.
+AUTHENTICATION_BACKENDS = [
+    'myauth.backends.CachedModelBackend',
+]
+# Сессия читается из кэша, в базу только пишется.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -196,6 +258,12 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
 
+# Ширины уменьшенных копий изображений товаров для srcset.
+IMAGE_RENDITION_WIDTHS = (160, 320, 640)
+IMAGE_RENDITION_WORKERS = 2
+# В тестах копии делаются сразу, без пула процессов.
+IMAGE_RENDITIONS_SYNC = TESTING
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
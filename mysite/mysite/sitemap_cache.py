@@ -0,0 +1,138 @@
+"""
+Разделы карты сайта с постраничным кэшем.
+
+Раздел делится на страницы по ``SITEMAP_PAGE_SIZE`` адресов, индекс
+``/sitemap.xml`` ссылается на каждую страницу. Из базы читаются только
+первичный ключ и поле ``lastmod_field``. Готовый XML страницы хранится
+в кэше под ключом, в который входят ``MAX(lastmod_field)``, ``COUNT(*)``
+и крайние pk строк самой страницы: изменение строки страницы или сдвиг
+ее границ дает новый ключ, а изменения на других страницах ключ не
+трогают. Значения для ключа считаются одним запросом на страницу.
+Индекс получает число страниц и ``Last-Modified`` из такого же запроса
+по всему разделу.
+"""
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.sitemaps import Sitemap, views
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, InvalidPage, PageNotAnInteger, Paginator
+from django.db.models import Count, Max, Min, QuerySet
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.functional import cached_property
+from django.utils.translation import get_language
+
+SITEMAP_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class CachedSitemap(Sitemap):
+    lastmod_field = 'updated_at'
+
+    def get_queryset(self) -> QuerySet:
+        raise NotImplementedError
+
+    def items(self):
+        # Сортировка по pk: новые строки попадают на последнюю страницу,
+        # остальные страницы не сдвигаются и остаются в кэше.
+        return self.get_queryset().only('pk', self.lastmod_field).order_by('pk')
+
+    def lastmod(self, obj):
+        return getattr(obj, self.lastmod_field)
+
+    @property
+    def limit(self) -> int:
+        return getattr(settings, 'SITEMAP_PAGE_SIZE', 10_000)
+
+    @cached_property
+    def stats(self) -> dict:
+        return self.get_queryset().order_by().aggregate(
+            last_modified=Max(self.lastmod_field),
+            count=Count('pk'),
+        )
+
+    @cached_property
+    def paginator(self) -> Paginator:
+        paginator = Paginator(self.items(), self.limit)
+        # Число строк уже известно - без отдельного COUNT.
+        paginator.count = self.stats['count']
+        return paginator
+
+    def get_latest_lastmod(self):
+        return self.stats['last_modified']
+
+    def page_stats(self, page) -> dict:
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(page)
+        if number < 1:
+            raise EmptyPage(page)
+        offset = (number - 1) * self.limit
+        stats = self.items()[offset:offset + self.limit].aggregate(
+            last_modified=Max(self.lastmod_field),
+            count=Count('pk'),
+            first=Min('pk'),
+            last=Max('pk'),
+        )
+        if not stats['count'] and number > 1:
+            raise EmptyPage(page)
+        return stats
+
+    def cache_key(self, page, protocol: str, domain: str) -> str:
+        stats = self.page_stats(page)
+        last_modified = stats['last_modified']
+        raw = ':'.join((
+            f'{type(self).__module__}.{type(self).__qualname__}',
+            str(page),
+            protocol,
+            domain,
+            get_language() or '',
+            str(stats['count']),
+            str(stats['first']),
+            str(stats['last']),
+            last_modified.isoformat() if last_modified else '',
+        ))
+        return f'sitemap:{md5(raw.encode()).hexdigest()}'
+
+
+@views.x_robots_tag
+def sitemap(
+        request: HttpRequest,
+        sitemaps: dict,
+        section: str,
+        template_name: str = 'sitemap.xml',
+        content_type: str = 'application/xml',
+) -> HttpResponse:
+    """
+    ``django.contrib.sitemaps.views.sitemap`` для одного раздела
+    с кэшем готового XML страницы.
+    """
+    if section not in sitemaps:
+        raise Http404(f'No sitemap available for section: {section!r}')
+    site = sitemaps[section]
+    if callable(site):
+        site = site()
+    page = request.GET.get('p', '1')
+    try:
+        key = site.cache_key(page, site.get_protocol(request.scheme), get_current_site(request).domain)
+    except InvalidPage:
+        raise Http404(f'No page {page!r}')
+    cached = cache.get(key)
+    if cached is None:
+        response = views.sitemap(
+            request,
+            {section: site},
+            section=section,
+            template_name=template_name,
+            content_type=content_type,
+        )
+        response.render()
+        cached = (response.content, response.get('Last-Modified'))
+        cache.set(key, cached, SITEMAP_CACHE_TIMEOUT)
+
+    content, last_modified = cached
+    response = HttpResponse(content, content_type=content_type)
+    if last_modified:
+        response['Last-Modified'] = last_modified
+    return response
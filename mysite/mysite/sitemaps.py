@@ -1,5 +1,7 @@
 from blogapp.sitemap import BlogSitemap
+from shopapp.sitemap import ProductSitemap
 
 sitemaps = {
     "blog": BlogSitemap,
-}
\ No newline at end of file
+    "products": ProductSitemap,
+}
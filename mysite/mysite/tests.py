@@ -0,0 +1,112 @@
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from blogapp.models import Article
+from mysite.cache_backends import TwoTierCache
+from requestdataapp.querycheck import query_budget
+from shopapp.models import Product
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = TemporaryDirectory()
+        self.cache = self.make_cache()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def make_cache(self, **options):
+        params = {
+            'OPTIONS': {
+                'LOCAL_MAX_ENTRIES': 2,
+                'LOCAL_EXCLUDE_PREFIXES': ['version:'],
+                **options,
+            },
+        }
+        return TwoTierCache(self.tmp_dir.name, params)
+
+    def test_second_read_is_served_from_local_tier(self):
+        self.cache.set('key', {'a': 1})
+        other_worker = self.make_cache()
+        self.assertEqual(other_worker.get('key'), {'a': 1})
+        self.assertEqual(other_worker.get('key'), {'a': 1})
+        self.assertEqual(
+            other_worker.get_stats(),
+            {'local_hits': 1, 'shared_hits': 1, 'misses': 0, 'local_evictions': 0, 'local_entries': 1},
+        )
+
+    def test_local_tier_is_size_bounded(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['local_entries'], 2)
+        self.assertEqual(stats['local_evictions'], 1)
+        self.assertEqual(self.cache.get('a'), 'a')
+
+    def test_per_key_timeout(self):
+        self.cache.set('key', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get_stats()['misses'], 1)
+
+    def test_excluded_keys_are_always_read_from_shared_tier(self):
+        self.cache.set('version:products', 1)
+        self.cache.get('version:products')
+        self.make_cache().incr('version:products')
+        self.assertEqual(self.cache.get('version:products'), 2)
+        self.assertEqual(self.cache.get_stats()['local_hits'], 0)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    SITEMAP_PAGE_SIZE=10,
+)
+class SitemapTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        Article.objects.create(title='Published', published_at=timezone.now() - timedelta(days=1))
+        Article.objects.create(title='Draft')
+
+    def test_index_links_every_page(self):
+        response = self.client.get('/sitemap.xml')
+        self.assertContains(response, 'http://testserver/sitemap-blog.xml</loc>')
+        self.assertContains(response, 'http://testserver/sitemap-products.xml</loc>')
+        for page in (2, 3):
+            self.assertContains(response, f'http://testserver/sitemap-products.xml?p={page}</loc>')
+        self.assertNotContains(response, 'sitemap-products.xml?p=4')
+
+    def test_pages_list_only_active_products(self):
+        response = self.client.get('/sitemap-products.xml', {'p': 1})
+        self.assertContains(response, '<url>', count=10)
+        self.assertContains(response, 'http://testserver/en/shop/products/1/</loc>')
+        self.assertNotContains(response, '/shop/products/9/<')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get('/sitemap-products.xml', {'p': 4}).status_code, 404)
+        self.assertContains(self.client.get('/sitemap-blog.xml'), '<url>', count=1)
+
+    def test_page_is_cached_until_rows_change(self):
+        first = self.client.get('/sitemap-products.xml', {'p': 1}).content
+        with query_budget(1):
+            self.assertEqual(self.client.get('/sitemap-products.xml', {'p': 1}).content, first)
+
+        Product.objects.filter(pk=1).update(name='Renamed')
+        self.assertNotEqual(self.client.get('/sitemap-products.xml', {'p': 1}).content, first)
+
+        Product.objects.filter(pk=1).update(archived=True)
+        self.assertNotContains(self.client.get('/sitemap-products.xml', {'p': 1}), '/shop/products/1/<')
+
+    def test_changes_on_other_pages_keep_page_cached(self):
+        first = self.client.get('/sitemap-products.xml', {'p': 1}).content
+        last = Product.objects.filter(archived=False).order_by('pk').last()
+        Product.objects.filter(pk=last.pk).update(name='Renamed')
+        Product.objects.create(name='New product')
+        with query_budget(1):
+            self.assertEqual(self.client.get('/sitemap-products.xml', {'p': 1}).content, first)
+        self.assertEqual(self.client.get('/sitemap-products.xml', {'p': 'x'}).status_code, 404)
@@ -26,7 +26,9 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
-from django.contrib.sitemaps.views import sitemap
+from django.contrib.sitemaps import views as sitemap_views
+from requestdataapp.views import metrics_view
+from .sitemap_cache import sitemap
 from .sitemaps import sitemaps
 
 urlpatterns = [
@@ -39,13 +41,20 @@ urlpatterns = [
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('api/', include('myapiapp.urls')),
     path('blog/', include('blogapp.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
     path(
         'sitemap.xml',
+        sitemap_views.index,
+        {'sitemaps': sitemaps},
+        name="django.contrib.sitemaps.views.index",
+    ),
+    path(
+        'sitemap-<section>.xml',
         sitemap,
         {'sitemaps': sitemaps},
         name="django.contrib.sitemaps.views.sitemap",
-    )
+    ),
 ]
 
 urlpatterns += i18n_patterns(
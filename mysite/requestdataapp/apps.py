@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class RequestdataappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'requestdataapp'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .metrics import install_query_recorder
+        from .querycheck import install_query_inspector
+
+        connection_created.connect(install_query_recorder)
+        connection_created.connect(install_query_inspector)
@@ -0,0 +1,227 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый процесс копит метрики у себя в памяти: обновление - это пара
+операций со словарем под коротким локом. Не чаще раза в
+``METRICS_FLUSH_INTERVAL`` секунд процесс сбрасывает снимок в файл
+``METRICS_DIR/metrics-<pid>.json``. Эндпоинт ``/metrics`` складывает
+снимки всех воркеров gunicorn и отдает их текстом для Prometheus.
+Процесс удаляет свой снимок при выходе; снимки процессов, которые
+завершились без этого, удаляются при сборке.
+
+Запросы к базе считаются обертками, которые ставятся на каждое
+соединение при его создании; текущий запрос определяется через
+contextvar, поэтому учитываются и запросы async ORM, выполняемые
+в потоке ``sync_to_async``.
+"""
+import atexit
+import json
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+COUNTERS = {
+    'http_requests_total': 'Total HTTP requests by view, method and status',
+    'http_response_size_bytes_total': 'Total size of non-streaming response bodies',
+    'http_exceptions_total': 'Unhandled exceptions raised by views',
+    'db_queries_total': 'Database queries executed while handling requests',
+    'db_query_duration_seconds_total': 'Time spent in database queries while handling requests',
+    'db_query_budget_exceeded_total': 'Views that made more queries than their query budget',
+    'db_repeated_queries_total': 'Requests with a query shape repeated QUERY_REPEAT_THRESHOLD times or more',
+}
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by view', LATENCY_BUCKETS),
+    'http_request_db_queries': ('Database queries per request by view', QUERY_COUNT_BUCKETS),
+}
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+current_request_stats: ContextVar[RequestStats | None] = ContextVar('current_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsRegistry:
+    def __init__(self, directory: Path, flush_interval: float, worker_id: str | None = None):
+        self.directory = Path(directory)
+        # По умолчанию pid на момент сброса: воркеры gunicorn форкаются
+        # уже после импорта модуля.
+        self.worker_id = worker_id
+        self.flush_interval = flush_interval
+        self._lock = Lock()
+        self._counters: dict[str, dict[str, float]] = {name: {} for name in COUNTERS}
+        self._histograms: dict[str, dict[str, list]] = {name: {} for name in HISTOGRAMS}
+        self._last_flush = time.monotonic()
+        self._exit_hook_pid = None
+
+    def _snapshot_path(self) -> Path:
+        return self.directory / f'metrics-{self.worker_id or os.getpid()}.json'
+
+    def remove_snapshot(self):
+        self._snapshot_path().unlink(missing_ok=True)
+
+    @staticmethod
+    def _labels_key(labels: dict) -> str:
+        return json.dumps(labels, sort_keys=True)
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = self._labels_key(labels)
+        with self._lock:
+            counter = self._counters[name]
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float):
+        buckets = HISTOGRAMS[name][1]
+        index = bisect_left(buckets, value)
+        key = self._labels_key(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                # Счетчики по бакетам (последний - +Inf), сумма, количество.
+                histogram = self._histograms[name][key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': {name: dict(values) for name, values in self._counters.items()},
+                'histograms': {
+                    name: {key: [list(buckets), total, count] for key, (buckets, total, count) in values.items()}
+                    for name, values in self._histograms.items()
+                },
+            }
+
+    def flush_due(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self, force: bool = False):
+        if not force and not self.flush_due():
+            return
+        self._last_flush = time.monotonic()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(tmp_path, self._snapshot_path())
+        if self.worker_id is None and self._exit_hook_pid != os.getpid():
+            # Регистрируем уже в воркере: хук из мастера достался бы
+            # после fork всем воркерам с pid мастера в имени файла.
+            self._exit_hook_pid = os.getpid()
+            atexit.register(self.remove_snapshot)
+
+    def collect(self) -> dict:
+        """
+        Складывает снимки всех процессов, включая текущий.
+        """
+        self.flush(force=True)
+        merged = {
+            'counters': {name: {} for name in COUNTERS},
+            'histograms': {name: {} for name in HISTOGRAMS},
+        }
+        for path in self.directory.glob('metrics-*.json'):
+            if _is_stale(path):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.get('counters', {}).items():
+                target = merged['counters'].setdefault(name, {})
+                for key, value in values.items():
+                    target[key] = target.get(key, 0) + value
+            for name, values in snapshot.get('histograms', {}).items():
+                target = merged['histograms'].setdefault(name, {})
+                for key, (buckets, total, count) in values.items():
+                    if key not in target:
+                        target[key] = [list(buckets), total, count]
+                        continue
+                    existing = target[key]
+                    existing[0] = [a + b for a, b in zip(existing[0], buckets)]
+                    existing[1] += total
+                    existing[2] += count
+        return merged
+
+
+def _is_stale(path: Path) -> bool:
+    # Снимок процесса, которого уже нет (упал, убит по таймауту).
+    pid = path.stem.removeprefix('metrics-')
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus(merged: dict) -> str:
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(merged['counters'].get(name, {}).items()):
+            lines.append(f'{name}{_format_labels(json.loads(key))} {value}')
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, (buckets, total, count) in sorted(merged['histograms'].get(name, {}).items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, bucket_count in zip((*bounds, '+Inf'), buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels({**labels, "le": bound})} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(
+    directory=getattr(settings, 'METRICS_DIR', Path(tempfile.gettempdir()) / 'mysite-metrics'),
+    flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5),
+)
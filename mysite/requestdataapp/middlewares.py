@@ -1,34 +1,99 @@
-from django.http import HttpRequest
+import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
 
+from .metrics import RequestStats, current_request_stats, registry
+
+
+@sync_and_async_middleware
 def set_useragent_on_request_middleware(get_response):
-    print("initial call")
+    if iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            request.user_agent = request.META.get('HTTP_USER_AGENT', '')
+            return await get_response(request)
+
+        return middleware
 
     def middleware(request: HttpRequest):
-        print("before get response")
-        request.user_agent = request.META['HTTP_USER_AGENT']
-        response = get_response(request)
-        print("after get response")
-        return response
+        request.user_agent = request.META.get('HTTP_USER_AGENT', '')
+        return get_response(request)
 
     return middleware
 
 
-class CountRequestMiddleware:
+class RequestMetricsMiddleware:
+    """
+    Собирает метрики по каждому view: задержку, число и время запросов
+    к базе, размер ответа и исключения. Отдаются на ``/metrics``.
+
+    Стоит первым в MIDDLEWARE, чтобы учитывать и запросы
+    остальных middleware (сессии, пользователь).
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.requests_count = 0
-        self.responses_count = 0
-        self.exceptions_count = 0
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request: HttpRequest):
-        self.requests_count += 1
-        print('request count', self.requests_count)
-        response = self.get_response(request)
-        self.responses_count += 1
-        print('response count', self.responses_count)
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start, flush=False)
+        if registry.flush_due():
+            # Запись снимка - файловый ввод-вывод, не в цикле событий.
+            await sync_to_async(registry.flush, thread_sensitive=False)()
         return response
 
+    @staticmethod
+    def view_label(request: HttpRequest) -> str:
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else '<unmatched>'
+
+    def record(
+            self,
+            request: HttpRequest,
+            response: HttpResponse,
+            stats: RequestStats,
+            duration: float,
+            flush: bool = True,
+    ):
+        view = self.view_label(request)
+        registry.inc('http_requests_total', {'view': view, 'method': request.method, 'status': response.status_code})
+        registry.observe('http_request_duration_seconds', {'view': view}, duration)
+        registry.observe('http_request_db_queries', {'view': view}, stats.queries)
+        if stats.queries:
+            registry.inc('db_queries_total', {'view': view}, stats.queries)
+            registry.inc('db_query_duration_seconds_total', {'view': view}, stats.query_time)
+        if not response.streaming:
+            registry.inc('http_response_size_bytes_total', {'view': view}, len(response.content))
+        if flush:
+            registry.flush()
+
     def process_exception(self, request: HttpRequest, exception: Exception):
-        self.exceptions_count += 1
-        print('got', self.exceptions_count, 'exceptions so far')
+        registry.inc(
+            'http_exceptions_total',
+            {'view': self.view_label(request), 'exception': type(exception).__name__},
+        )
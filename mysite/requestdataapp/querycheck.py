@@ -0,0 +1,295 @@
+"""
+Поиск N+1 и бюджеты запросов к базе.
+
+Каждый запрос к базе сводится к «форме» - SQL без значений, с
+``IN (...)`` любой длины, сжатым в одно место. Если за один HTTP-запрос
+одна и та же форма выполняется ``QUERY_REPEAT_THRESHOLD`` раз и больше,
+это почти всегда N+1: забыли ``select_related``/``prefetch_related``.
+``QueryInspectionMiddleware`` сообщает о таких формах вместе с местом
+в коде или шаблоне, откуда пришел первый запрос.
+
+``query_budget`` ограничивает число запросов view (или блока кода в
+тесте). При ``QUERY_BUDGET_RAISE`` (включено в тестах) превышение
+бюджета и найденный N+1 - это исключение, в остальных случаях -
+предупреждение в логе и счетчик в ``/metrics``.
+
+Все проверки работают только при ``QUERY_INSPECTION``: без нее обертка
+запросов не ставится, а ``query_budget`` ничего не считает.
+"""
+import functools
+import logging
+import re
+import sys
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest
+from django.template.base import Node
+
+from . import metrics, middlewares
+from .metrics import registry
+
+log = logging.getLogger(__name__)
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_INSTRUMENTATION_FILES = {__file__, metrics.__file__, middlewares.__file__}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql: str) -> str:
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _LITERAL_RE.sub('?', sql)
+
+
+def _relative(filename: str) -> str:
+    return filename[len(_PROJECT_DIR) + 1:] if filename.startswith(_PROJECT_DIR) else filename
+
+
+def find_call_site() -> str:
+    """
+    Место, откуда пришел запрос: ближайшие строка шаблона и строка
+    кода проекта (не Django и не сторонних пакетов).
+    """
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and code is None:
+        filename = frame.f_code.co_filename
+        # type() вместо isinstance: isinstance вычислил бы ленивые
+        # объекты вроде request.user и породил бы новые запросы.
+        node = frame.f_locals.get('self')
+        if template is None and issubclass(type(node), Node):
+            if node.origin is not None and node.token is not None:
+                template = f'{_relative(node.origin.name)}:{node.token.lineno}'
+        if (
+            filename.startswith(_PROJECT_DIR)
+            and filename not in _INSTRUMENTATION_FILES
+            and 'site-packages' not in filename
+        ):
+            code = f'{_relative(filename)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ', '.join(site for site in (template, code) if site) or '<unknown>'
+
+
+class QueryLog:
+    """
+    Запросы одного HTTP-запроса или блока под бюджетом.
+
+    Для каждой формы хранится число выполнений и место первого вызова;
+    стек разбирается один раз на форму. Запросы передаются и во
+    внешний журнал, поэтому бюджет view не мешает middleware.
+    """
+
+    def __init__(self, parent: 'QueryLog | None' = None):
+        self.parent = parent
+        self.count = 0
+        self.shapes: dict[str, list] = {}
+
+    def add(self, sql: str, call_site: str | None = None):
+        self.count += 1
+        shape = query_shape(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            call_site = call_site or find_call_site()
+            self.shapes[shape] = [1, call_site]
+        else:
+            entry[0] += 1
+            call_site = entry[1]
+        if self.parent is not None:
+            self.parent.add(sql, call_site)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int, str]]:
+        return sorted(
+            (
+                (shape, count, call_site)
+                for shape, (count, call_site) in self.shapes.items()
+                if count >= threshold
+            ),
+            key=lambda item: -item[1],
+        )
+
+
+current_query_log: ContextVar[QueryLog | None] = ContextVar('current_query_log', default=None)
+
+
+def inspect_query(execute, sql, params, many, context):
+    query_log = current_query_log.get()
+    if query_log is not None:
+        query_log.add(sql)
+    return execute(sql, params, many, context)
+
+
+def inspection_enabled() -> bool:
+    return getattr(settings, 'QUERY_INSPECTION', False)
+
+
+def install_query_inspector(sender, connection, **kwargs):
+    if inspection_enabled() and inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_query)
+
+
+def report(label: str, message: str, metric: str):
+    registry.inc(metric, {'view': label})
+    if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+        raise QueryBudgetExceeded(message)
+    log.warning(message)
+
+
+def format_repeated(repeated: list[tuple[str, int, str]]) -> str:
+    return '\n'.join(
+        f'  {count} x {shape[:200]}\n    at {call_site}'
+        for shape, count, call_site in repeated
+    )
+
+
+class query_budget:
+    """
+    Бюджет запросов к базе для view или блока кода::
+
+        @query_budget(4)
+        def get(self, request, *args, **kwargs): ...
+
+        with query_budget(3):
+            self.client.get(url)
+
+    Работает с sync и async функциями. Ответ ``TemplateResponse``
+    рендерится внутри бюджета, чтобы учитывались и запросы из шаблона.
+    """
+
+    def __init__(self, max_queries: int, label: str | None = None):
+        self.max_queries = max_queries
+        self.label = label
+
+    def start(self) -> tuple[QueryLog | None, object]:
+        if not inspection_enabled():
+            return None, None
+        query_log = QueryLog(parent=current_query_log.get())
+        return query_log, current_query_log.set(query_log)
+
+    @staticmethod
+    def reset(token):
+        if token is not None:
+            current_query_log.reset(token)
+
+    def finish(self, query_log: QueryLog | None, token, label: str):
+        self.reset(token)
+        if query_log is None or query_log.count <= self.max_queries:
+            return
+        message = f'{label} made {query_log.count} queries, budget is {self.max_queries}'
+        repeated = query_log.repeated(2)
+        if repeated:
+            message += '\nRepeated queries:\n' + format_repeated(repeated)
+        report(label, message, 'db_query_budget_exceeded_total')
+
+    def __enter__(self):
+        self._query_log, self._token = self.start()
+        return self._query_log
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish(self._query_log, self._token, self.label or 'block')
+        else:
+            self.reset(self._token)
+
+    def __call__(self, func):
+        label = self.label or func.__qualname__
+
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                query_log, token = self.start()
+                try:
+                    response = await func(*args, **kwargs)
+                    self.render(response)
+                except BaseException:
+                    self.reset(token)
+                    raise
+                self.finish(query_log, token, label)
+                return response
+
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            query_log, token = self.start()
+            try:
+                response = func(*args, **kwargs)
+                self.render(response)
+            except BaseException:
+                self.reset(token)
+                raise
+            self.finish(query_log, token, label)
+            return response
+
+        return wrapper
+
+    @staticmethod
+    def render(response):
+        # Ответ DRF без шаблона рендерит позже сам view, когда выберет
+        # рендерер; данные к этому моменту уже сериализованы.
+        if (
+            callable(getattr(response, 'render', None))
+            and not getattr(response, 'is_rendered', True)
+            and getattr(response, 'template_name', None)
+        ):
+            response.render()
+
+
+class QueryInspectionMiddleware:
+    """
+    Ищет N+1 в каждом запросе. Включается настройкой ``QUERY_INSPECTION``;
+    если она выключена, middleware убирает себя из цепочки.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not inspection_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if self.async_mode:
+            return self.__acall__(request)
+        query_log = QueryLog(parent=current_query_log.get())
+        token = current_query_log.set(query_log)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_log.reset(token)
+        self.check(request, query_log)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        query_log = QueryLog(parent=current_query_log.get())
+        token = current_query_log.set(query_log)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_log.reset(token)
+        self.check(request, query_log)
+        return response
+
+    def check(self, request: HttpRequest, query_log: QueryLog):
+        repeated = query_log.repeated(self.threshold)
+        if not repeated:
+            return
+        match = getattr(request, 'resolver_match', None)
+        label = match.view_name if match else request.path
+        report(
+            label,
+            f'Possible N+1 in {label} ({request.method} {request.path}):\n{format_repeated(repeated)}',
+            'db_repeated_queries_total',
+        )
@@ -1,3 +1,77 @@
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from requestdataapp.metrics import MetricsRegistry, registry, render_prometheus
+
+
+class MetricsRegistryTestCase(TestCase):
+    def test_snapshots_of_workers_are_merged(self):
+        with TemporaryDirectory() as directory:
+            workers = [
+                MetricsRegistry(directory, flush_interval=60, worker_id=worker_id)
+                for worker_id in ('web-1', 'web-2')
+            ]
+            for worker in workers:
+                worker.inc('http_requests_total', {'view': 'index', 'method': 'GET', 'status': 200})
+                worker.observe('http_request_duration_seconds', {'view': 'index'}, 0.02)
+            workers[0].flush(force=True)
+            text = render_prometheus(workers[1].collect())
+        self.assertIn('http_requests_total{method="GET",status="200",view="index"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="index",le="0.01"} 0', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="index",le="0.025"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{view="index"} 2', text)
+
+
+    def test_snapshots_of_dead_workers_are_dropped(self):
+        dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        with TemporaryDirectory() as directory:
+            stale = Path(directory) / f'metrics-{dead.stdout.strip()}.json'
+            stale.write_text('{"counters": {"http_requests_total": {"{}": 100}}}')
+            registry = MetricsRegistry(directory, flush_interval=60)
+            registry.inc('http_requests_total', {})
+            merged = registry.collect()
+            self.assertEqual(merged['counters']['http_requests_total'], {'{}': 1})
+            self.assertFalse(stale.exists())
+
+            registry.remove_snapshot()
+            self.assertEqual(list(Path(directory).iterdir()), [])
+
+
+class MetricsViewTestCase(TestCase):
+    def test_requests_are_counted_per_view(self):
+        self.client.get(reverse('myauth:foo-bar'), HTTP_USER_AGENT='Mozilla/5.0')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(
+            'http_requests_total{method="GET",status="200",view="myauth:foo-bar"}',
+            response.content.decode(),
+        )
+
+    def test_metrics_are_private(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='metrics_staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+    async def test_async_requests_flush_outside_event_loop(self):
+        threads = []
+        flush = registry.flush
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return flush(*args, **kwargs)
 
-# Create your tests here.
+        with patch.object(registry, 'flush_interval', 0), patch.object(registry, 'flush', record_thread):
+            response = await self.async_client.get(reverse('myauth:foo-bar'), HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
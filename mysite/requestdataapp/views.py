@@ -1,8 +1,11 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.core.files.storage import FileSystemStorage
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 
 from requestdataapp.forms import UserBioForm, UploadFileForm
+from requestdataapp.metrics import registry, render_prometheus
 
 
 # Create your views here.
@@ -39,4 +42,14 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
     context = {
         "form": form,
     }
-    return render(request, 'requestdataapp/file-upload.html', context=context)
\ No newline at end of file
+    return render(request, 'requestdataapp/file-upload.html', context=context)
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    # Метрики раскрывают задержки и запросы всех view: только для
+    # адресов из METRICS_ALLOWED_IPS и персонала.
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        render_prometheus(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,17 +1,21 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
 
 from shopapp.models import Product, Order, ProductImage
-from .admin_mixins import ExportAsCSWMixin
+from .admin_mixins import CachedChoicesInlineMixin, ExportAsCSWMixin, QueryBudgetAdminMixin
 from .common import save_csv_products
 from .forms import CSVImportForm
+from .search import search_products
+
+CSV_IMPORT_ERRORS_SHOWN = 10
 
 
 # Register your models here.
-class OrderInline(admin.TabularInline):
+class OrderInline(CachedChoicesInlineMixin, admin.TabularInline):
     model = Product.orders.through
 
 
@@ -27,9 +31,9 @@ def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset
     queryset.update(archived=False)
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin, ExportAsCSWMixin):
+class ProductAdmin(QueryBudgetAdminMixin, admin.ModelAdmin, ExportAsCSWMixin):
     change_list_template = "shopapp/products_changelist.html"
-    actions = [mark_archived, mark_unarchived, 'export_csv',]
+    actions = [mark_archived, mark_unarchived, 'export_csv', 'export_jsonl',]
     inlines = [OrderInline, ProductInline]
     #list_display = 'pk', 'name', 'description', 'price', 'discount'
     list_display = 'pk', 'name', 'description_short', 'price', 'discount', 'archived'
@@ -52,6 +56,12 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSWMixin):
                            'description': 'Extra options. Field "archived" is for soft delete'})
     ]
 
+    def get_search_results(self, request, queryset, search_term):
+        result = search_products(queryset, search_term.split(), rank=False)
+        if result is None:
+            return super().get_search_results(request, queryset, search_term)
+        return result, False
+
     def description_short(self, obj: Product) -> str:
         if len(obj.description) < 48:
             return obj.description
@@ -70,18 +80,30 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSWMixin):
                 'form': form,
             }
             return render(request, 'admin/csv_form.html', context, status=400)
-        save_csv_products(
-            file=request.FILES['csv_file'].file,
-            encoding=request.encoding,
+        try:
+            result = save_csv_products(
+                file=request.FILES['csv_file'].file,
+                encoding=request.encoding,
+                upsert=form.cleaned_data['upsert'],
+            )
+        except ValidationError as exc:
+            form.add_error('csv_file', exc)
+            context = {
+                'form': form,
+            }
+            return render(request, 'admin/csv_form.html', context, status=400)
+        self.message_user(
+            request,
+            f"Data from CSV was imported: {result.created} created, {result.updated} updated",
         )
-        # reader = DictReader(csv_file)
-        #
-        # products = [
-        #     Product(**row)
-        #     for row in reader
-        # ]
-        # Product.objects.bulk_create(products)
-        self.message_user(request, "Data from CSV was imported")
+        for line, errors in result.errors[:CSV_IMPORT_ERRORS_SHOWN]:
+            self.message_user(request, f"Line {line} skipped: {errors}", level=messages.WARNING)
+        if result.skipped > CSV_IMPORT_ERRORS_SHOWN:
+            self.message_user(
+                request,
+                f"{result.skipped - CSV_IMPORT_ERRORS_SHOWN} more lines skipped",
+                level=messages.WARNING,
+            )
         return redirect("..")
 
 
@@ -100,13 +122,15 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSWMixin):
 #admin.site.register(Product, ProductAdmin)
 
 #class ProductInline(admin.TabularInline):
-class ProductInline(admin.StackedInline):
+class ProductInline(CachedChoicesInlineMixin, admin.StackedInline):
     model = Order.products.through
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(QueryBudgetAdminMixin, admin.ModelAdmin, ExportAsCSWMixin):
+    actions = ['export_csv', 'export_jsonl',]
     inlines = [ProductInline,]
-    list_display = 'delivery_address', 'promocode', 'created_at', 'user'
+    list_display = 'delivery_address', 'promocode', 'created_at', 'user', 'products_count', 'total'
+    readonly_fields = 'products_count', 'total'
     def get_queryset(self, request):
         return Order.objects.select_related('user').prefetch_related('products')
 
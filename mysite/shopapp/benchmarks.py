@@ -0,0 +1,338 @@
+"""
+Нагрузочные замеры основных страниц и API внутри процесса.
+
+Каждый сценарий - функция ``(client, data) -> response``, которая делает
+один запрос через тестовый клиент Django. ``run_benchmarks`` гоняет
+сценарии по ``iterations`` раз и для каждого считает p50/p95/p99
+задержки, пропускную способность, число запросов к базе и пиковую
+память одного запроса. ``compare_results`` сверяет результат с
+сохраненной базовой линией и возвращает список регрессий.
+"""
+import math
+import platform
+import time
+import tracemalloc
+from io import StringIO
+from random import Random
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import translation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from requestdataapp.querycheck import QueryLog, current_query_log
+
+from blogapp.models import Article
+from .common import CSV_IMPORT_FIELDS, stream_csv
+from .datagen import ADJECTIVES, NOUNS, GenerationPlan, generate
+from .models import Order, Product
+from .serializers import ProductSerializer, ValuesSerializer
+
+BENCHMARK_USERNAME = 'benchmark_admin'
+CSV_UPLOAD_ROWS = 100
+
+
+class BenchmarkData:
+    """
+    Набор данных для сценариев. Объекты для запросов выбираются
+    генератором с заданным ``seed``, поэтому прогон повторяем.
+    """
+
+    def __init__(self, product_ids: list[int], order_ids: list[int], seed: int):
+        self.product_ids = product_ids
+        self.order_ids = order_ids
+        self.random = Random(seed)
+        self.search_terms = [f'{adjective} {noun}' for adjective in ADJECTIVES for noun in NOUNS]
+        self._csv_upload_body = None
+
+    def product_id(self) -> int:
+        return self.random.choice(self.product_ids)
+
+    def search_term(self) -> str:
+        return self.random.choice(self.search_terms)
+
+    def csv_upload_body(self) -> bytes:
+        """
+        CSV с уже существующими товарами: загрузка с ``upsert``
+        обновляет их и не раздувает таблицу от прогона к прогону.
+        """
+        if self._csv_upload_body is None:
+            rows = (
+                Product.objects
+                .filter(pk__in=self.product_ids[:CSV_UPLOAD_ROWS])
+                .values_list(*CSV_IMPORT_FIELDS)
+            )
+            self._csv_upload_body = ''.join(stream_csv(CSV_IMPORT_FIELDS, rows)).encode()
+        return self._csv_upload_body
+
+
+def seed_dataset(products: int, orders: int, articles: int, seed: int = 0) -> BenchmarkData:
+    User.objects.create_superuser(username=BENCHMARK_USERNAME, password='benchmark')
+    plan = GenerationPlan(
+        users=max(1, orders // 4),
+        products=products,
+        orders=orders,
+        articles=articles,
+        seed=seed,
+    )
+    generate(plan)
+    order_ids = list(Order.objects.order_by('pk').values_list('pk', flat=True))
+    return BenchmarkData(list(plan.product_ids), order_ids, seed)
+
+
+def product_list(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:products_list'))
+
+
+def product_detail(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:product_detail', kwargs={'pk': data.product_id()}))
+
+
+def api_products_list(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:products-list'))
+
+
+def api_products_search(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:products-list'), {'search': data.search_term()})
+
+
+def api_products_filter(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:products-list'), {'archived': 'false', 'ordering': '-price'})
+
+
+def csv_download(client, data: BenchmarkData):
+    response = client.get(reverse('shopapp:products-download-csv'))
+    # Тело потоковое: без чтения замер не включал бы саму выгрузку.
+    for _ in response.streaming_content:
+        pass
+    return response
+
+
+def csv_upload(client, data: BenchmarkData):
+    upload = SimpleUploadedFile('products.csv', data.csv_upload_body(), content_type='text/csv')
+    return client.post(f"{reverse('shopapp:products-upload-csv')}?upsert=1", {'products': upload})
+
+
+def order_list(client, data: BenchmarkData):
+    return client.get(reverse('shopapp:orders_list'))
+
+
+def blog_feed(client, data: BenchmarkData):
+    return client.get(reverse('blogapp:articles-feed'))
+
+
+def sitemap(client, data: BenchmarkData):
+    return client.get(reverse('django.contrib.sitemaps.views.sitemap', kwargs={'section': 'blog'}))
+
+
+def sitemap_index(client, data: BenchmarkData):
+    return client.get(reverse('django.contrib.sitemaps.views.index'))
+
+
+SCENARIOS = {
+    'product_list': product_list,
+    'product_detail': product_detail,
+    'api_products_list': api_products_list,
+    'api_products_search': api_products_search,
+    'api_products_filter': api_products_filter,
+    'csv_download': csv_download,
+    'csv_upload': csv_upload,
+    'order_list': order_list,
+    'blog_feed': blog_feed,
+    'sitemap': sitemap,
+    'sitemap_index': sitemap_index,
+}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def run_scenario(client, scenario, data: BenchmarkData, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        scenario(client, data)
+
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        query_log = QueryLog()
+        token = current_query_log.set(query_log)
+        start = time.perf_counter()
+        try:
+            response = scenario(client, data)
+        finally:
+            latencies.append(time.perf_counter() - start)
+            current_query_log.reset(token)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{scenario.__name__} returned {response.status_code}')
+        queries.append(query_log.count)
+
+    # Память меряем отдельным запросом: tracemalloc сильно
+    # замедляет выполнение и исказил бы задержки.
+    tracemalloc.start()
+    try:
+        scenario(client, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / sum(latencies), 1),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def benchmark_serializers(rows: int = 1000, repeat: int = 5) -> dict:
+    """
+    Микро-замер сериализации списка товаров: ``ProductSerializer`` против
+    ``ValuesSerializer``. Каждый проход - выборка ``rows`` товаров,
+    сериализация и рендеринг в JSON; берется лучший из ``repeat``.
+    """
+    request = Request(RequestFactory().get('/api/products/'))
+    context = {'request': request}
+    renderer = JSONRenderer()
+
+    def model_serializer() -> bytes:
+        queryset = Product.objects.order_by('pk')[:rows]
+        return renderer.render(ProductSerializer(queryset, many=True, context=context).data)
+
+    def values_serializer() -> bytes:
+        serializer = ValuesSerializer(ProductSerializer, context=context)
+        rows_data = serializer.values_list(Product.objects.order_by('pk'))[:rows]
+        return renderer.render(serializer.serialize(rows_data))
+
+    count = min(rows, Product.objects.count())
+    results = {'rows': count, 'identical': model_serializer() == values_serializer()}
+    for name, func in (('model_serializer', model_serializer), ('values_serializer', values_serializer)):
+        best = min(_timed(func) for _ in range(repeat))
+        results[f'{name}_rows_per_s'] = round(count / best)
+    results['speedup'] = round(results['values_serializer_rows_per_s'] / results['model_serializer_rows_per_s'], 2)
+    return results
+
+
+def benchmark_templates(items: int = 1000, repeat: int = 5) -> dict:
+    """
+    Время рендеринга списков товаров, заказов и статей в мс на 1000
+    элементов: без кэша фрагментов (``cold``, кэш очищается перед
+    каждым проходом) и с прогретым кэшем (``warm``). Объекты читаются
+    из базы один раз, замеряется только шаблон.
+    """
+    request = RequestFactory().get('/')
+    request.user = User.objects.get(username=BENCHMARK_USERNAME)
+    pages = {
+        'shopapp/products-list.html': {
+            'products': list(Product.objects.filter(archived=False).order_by('pk')[:items]),
+        },
+        'shopapp/order_list.html': {
+            'object_list': list(
+                Order.objects.select_related('user').prefetch_related('products').order_by('pk')[:items]
+            ),
+        },
+        'blogapp/article_list.html': {
+            'object_list': list(Article.objects.filter(published_at__isnull=False).order_by('pk')[:items]),
+        },
+    }
+
+    results = {}
+    with translation.override('en'):
+        for template_name, context in pages.items():
+            count = len(next(iter(context.values())))
+            if not count:
+                continue
+
+            def render() -> str:
+                return render_to_string(template_name, context, request=request)
+
+            def cold() -> str:
+                cache.clear()
+                return render()
+
+            cold_s = min(_timed(cold) for _ in range(repeat))
+            render()
+            warm_s = min(_timed(render) for _ in range(repeat))
+            results[template_name] = {
+                'items': count,
+                'cold_ms_per_1000': round(cold_s / count * 1000 * 1000, 1),
+                'warm_ms_per_1000': round(warm_s / count * 1000 * 1000, 1),
+                'speedup': round(cold_s / warm_s, 2),
+            }
+    return results
+
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_benchmarks(
+        data: BenchmarkData,
+        iterations: int,
+        warmup: int = 2,
+        names: list[str] | None = None,
+) -> dict:
+    from django.test import Client
+
+    client = Client(HTTP_USER_AGENT='Mozilla/5.0 (benchmark)')
+    client.force_login(User.objects.get(username=BENCHMARK_USERNAME))
+    results = {}
+    with translation.override('en'):
+        for name in names or SCENARIOS:
+            results[name] = run_scenario(client, SCENARIOS[name], data, iterations, warmup)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'products': len(data.product_ids),
+            'orders': len(data.order_ids),
+            'articles': Article.objects.count(),
+            'iterations': iterations,
+        },
+        'scenarios': results,
+    }
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0) -> list[str]:
+    """
+    Регрессии относительно базовой линии: число запросов выросло
+    или p50/p95 стали медленнее больше чем на ``tolerance`` (доля)
+    и больше чем на ``min_delta_ms``, чтобы не ловить шум.
+    """
+    regressions = []
+    for name, before in baseline['scenarios'].items():
+        after = current['scenarios'].get(name)
+        if after is None:
+            continue
+        if after['queries'] > before['queries']:
+            regressions.append(f'{name}: queries {before["queries"]} -> {after["queries"]}')
+        for metric in ('p50_ms', 'p95_ms'):
+            delta = after[metric] - before[metric]
+            if delta > before[metric] * tolerance and delta > min_delta_ms:
+                regressions.append(f'{name}: {metric} {before[metric]} -> {after[metric]}')
+    return regressions
+
+
+def format_table(results: dict) -> str:
+    out = StringIO()
+    out.write(f'{"scenario":<22}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"rps":>9}{"queries":>9}{"peak KB":>10}\n')
+    for name, result in results['scenarios'].items():
+        out.write(
+            f'{name:<22}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["p99_ms"]:>10}'
+            f'{result["throughput_rps"]:>9}{result["queries"]:>9}{result["peak_memory_kb"]:>10}\n'
+        )
+    return out.getvalue()
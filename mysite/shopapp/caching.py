@@ -0,0 +1,145 @@
+"""
+Версионированные ключи кэша для данных о товарах.
+
+Вместо удаления конкретных ключей при изменении товаров меняется
+номер версии, который входит в каждый ключ. Старые записи просто
+перестают читаться и истекают сами.
+
+Новая версия - текущее время в наносекундах, а не старая версия + 1:
+``incr`` файлового кэша читает и пишет файл без блокировки, и два
+воркера могли бы записать одну и ту же следующую версию. Запись
+времени не зависит от прежнего значения, поэтому после каждой смены
+версия отличается от всех, под которыми кто-то уже мог писать.
+"""
+from hashlib import md5
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+
+PRODUCTS_VERSION_KEY = 'shopapp:products:version'
+PRODUCTS_CACHE_TIMEOUT = 60 * 60 * 24
+# Версия кэша отдельных товаров. Префикс совпадает с PRODUCTS_VERSION_KEY,
+# поэтому TwoTierCache тоже не держит ее в локальном кэше.
+PRODUCT_DETAILS_VERSION_KEY = 'shopapp:products:version:details'
+
+
+def _get_version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        # Начинаем с текущего времени, а не с 1, чтобы после потери
+        # ключа версии не прочитать записи, оставшиеся от старой версии.
+        cache.add(key, time_ns(), None)
+        version = cache.get(key, time_ns())
+    return version
+
+
+async def _aget_version(key: str) -> int:
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time_ns(), None)
+        version = await cache.aget(key, time_ns())
+    return version
+
+
+def _bump_version(key: str) -> None:
+    cache.set(key, time_ns(), None)
+
+
+def get_products_version() -> int:
+    return _get_version(PRODUCTS_VERSION_KEY)
+
+
+async def aget_products_version() -> int:
+    return await _aget_version(PRODUCTS_VERSION_KEY)
+
+
+def bump_products_version() -> None:
+    # Версию меняем только после коммита: иначе другой воркер успеет
+    # закэшировать еще старые данные уже под новой версией.
+    transaction.on_commit(lambda: _bump_version(PRODUCTS_VERSION_KEY))
+
+
+def products_cache_key(name: str) -> str:
+    return f'shopapp:products:{name}:v{get_products_version()}'
+
+
+async def aproducts_cache_key(name: str) -> str:
+    return f'shopapp:products:{name}:v{await aget_products_version()}'
+
+
+# Кэш отдельных товаров для страницы товара и API: товар вместе с
+# картинками. В ключ входят общая версия и версия самого товара. Сигналы
+# и массовые операции ProductQuerySet после коммита меняют версии
+# измененных товаров, а если их больше PRODUCT_DETAILS_BUMP_LIMIT - общую.
+# Версии читаются до товара, поэтому товар, прочитанный до чужого коммита,
+# попадает в кэш под старой версией и уже не читается. Если товара нет,
+# это тоже кэшируется, но ненадолго, чтобы перебор несуществующих pk не
+# доходил до базы. В ключ входит и сама выборка: страница товара и API
+# читают товар разными queryset, и фильтр одного не должен пропасть у другого.
+PRODUCT_DETAIL_CACHE_TIMEOUT = 60 * 10
+MISSING_PRODUCT_CACHE_TIMEOUT = 60
+PRODUCT_DETAILS_BUMP_LIMIT = 100
+# Отметка «товара нет»; None от cache.get значит «нет в кэше».
+_MISSING = False
+
+
+def _product_version_key(pk) -> str:
+    return f'{PRODUCT_DETAILS_VERSION_KEY}:{pk}'
+
+
+def _get_versions(*keys: str) -> list[int]:
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else _get_version(key) for key in keys]
+
+
+async def _aget_versions(*keys: str) -> list[int]:
+    versions = await cache.aget_many(keys)
+    return [versions[key] if key in versions else await _aget_version(key) for key in keys]
+
+
+def _queryset_digest(queryset) -> str:
+    # prefetch_related не попадает в SQL, но меняет сохраняемый объект.
+    raw = f'{queryset.query}:{queryset._prefetch_related_lookups}'
+    return md5(raw.encode()).hexdigest()
+
+
+def product_detail_cache_key(queryset, pk, version: int, product_version: int) -> str:
+    return f'shopapp:product:{pk}:{_queryset_digest(queryset)}:v{version}:{product_version}'
+
+
+def get_product_detail(queryset, pk):
+    """
+    Товар ``pk`` из ``queryset`` через кэш или ``None``, если его нет.
+    """
+    versions = _get_versions(PRODUCT_DETAILS_VERSION_KEY, _product_version_key(pk))
+    key = product_detail_cache_key(queryset, pk, *versions)
+    product = cache.get(key)
+    if product is None:
+        product = queryset.filter(pk=pk).first() or _MISSING
+        cache.set(key, product, PRODUCT_DETAIL_CACHE_TIMEOUT if product else MISSING_PRODUCT_CACHE_TIMEOUT)
+    return product or None
+
+
+async def aget_product_detail(queryset, pk):
+    versions = await _aget_versions(PRODUCT_DETAILS_VERSION_KEY, _product_version_key(pk))
+    key = product_detail_cache_key(queryset, pk, *versions)
+    product = await cache.aget(key)
+    if product is None:
+        product = await queryset.filter(pk=pk).afirst() or _MISSING
+        await cache.aset(key, product, PRODUCT_DETAIL_CACHE_TIMEOUT if product else MISSING_PRODUCT_CACHE_TIMEOUT)
+    return product or None
+
+
+def invalidate_product_details(pks) -> None:
+    """
+    Меняет после коммита версии товаров ``pks``. Если pk больше
+    PRODUCT_DETAILS_BUMP_LIMIT, меняется общая версия.
+    """
+    pks = [pk for pk in pks if pk is not None]
+    if len(pks) > PRODUCT_DETAILS_BUMP_LIMIT:
+        transaction.on_commit(lambda: _bump_version(PRODUCT_DETAILS_VERSION_KEY))
+    elif pks:
+        transaction.on_commit(lambda: cache.set_many(
+            {_product_version_key(pk): time_ns() for pk in pks}, None,
+        ))
@@ -1,21 +1,311 @@
+import csv
+import json
 from csv import DictReader
-from io import TextIOWrapper
+from io import StringIO, TextIOWrapper
+from typing import Iterable, Iterator, Sequence
 
-from django.template.context_processors import request
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import QuerySet
 
-from shopapp.models import Product
+from django.contrib.auth.models import User
 
+from shopapp.models import Order, Product
 
-def save_csv_products(file, encoding):
+CSV_EXPORT_CHUNK_SIZE = 2000
+CSV_STREAM_ROWS_PER_CHUNK = 500
+CSV_IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+CSV_IMPORT_FIELDS = ('name', 'description', 'price', 'discount')
+ORDERS_IMPORT_BATCH_SIZE = 500
+# Сколько значений передавать одним IN (...): SQLite ограничивает
+# число параметров запроса.
+IN_LOOKUP_BATCH_SIZE = 500
+
+
+def stream_csv(
+    header: Sequence[str],
+    rows: Iterable[Sequence],
+    rows_per_chunk: int = CSV_STREAM_ROWS_PER_CHUNK,
+) -> Iterator[str]:
+    """
+    Отдает CSV по частям: заголовок и далее строки пачками.
+
+    Строки пишутся во временный буфер, который сбрасывается
+    каждые ``rows_per_chunk`` строк, поэтому в памяти держится
+    только одна пачка, а не весь файл.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def stream_jsonl(
+    fields: Sequence[str],
+    rows: Iterable[Sequence],
+    rows_per_chunk: int = CSV_STREAM_ROWS_PER_CHUNK,
+) -> Iterator[str]:
+    """
+    Отдает строки в формате JSON Lines: по объекту на строку, пачками.
+    """
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(dict(zip(fields, row))))
+        if len(chunk) >= rows_per_chunk:
+            chunk.append('')
+            yield '\n'.join(chunk)
+            chunk = []
+    if chunk:
+        chunk.append('')
+        yield '\n'.join(chunk)
+
+
+class ImportResult:
+    """
+    Итог импорта товаров из CSV или заказов из JSON Lines.
+
+    ``errors`` содержит пары (номер строки в файле, ошибки по полям)
+    для первых ``IMPORT_MAX_ERRORS`` пропущенных строк,
+    ``skipped`` считает все пропущенные строки.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors: list[tuple[int, dict[str, list[str]]]] = []
+
+    def add_error(self, line: int, errors: dict[str, list[str]]):
+        self.skipped += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append((line, errors))
+
+    def as_dict(self) -> dict:
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'errors': [
+                {'line': line, 'errors': errors}
+                for line, errors in self.errors
+            ],
+        }
+
+
+def _clean_csv_row(row: dict) -> dict:
+    values = {}
+    errors = {}
+    if row.pop(None, None) is not None:
+        errors[NON_FIELD_ERRORS] = ['Row has more values than the header']
+    for name, raw in row.items():
+        try:
+            values[name] = Product._meta.get_field(name).clean(raw, None)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def _write_products_batch(rows: list[dict], fields: list[str], upsert: bool, result: ImportResult):
+    with transaction.atomic():
+        to_create = rows
+        if upsert:
+            incoming = {row['name']: row for row in rows}
+            to_update = []
+            existing = Product.objects.filter(name__in=incoming).only('pk', 'name')
+            for product in existing.iterator():
+                for name, value in incoming[product.name].items():
+                    setattr(product, name, value)
+                to_update.append(product)
+            update_fields = [name for name in fields if name != 'name']
+            if to_update and update_fields:
+                Product.objects.bulk_update(to_update, update_fields)
+            result.updated += len(to_update)
+            matched = {product.name for product in to_update}
+            to_create = [row for name, row in incoming.items() if name not in matched]
+        Product.objects.bulk_create(Product(**row) for row in to_create)
+        result.created += len(to_create)
+
+
+def save_csv_products(
+    file,
+    encoding,
+    batch_size: int = CSV_IMPORT_BATCH_SIZE,
+    upsert: bool = False,
+) -> ImportResult:
+    """
+    Импортирует товары из CSV, читая файл построчно.
+
+    Строки проверяются по полям модели и записываются пачками
+    по ``batch_size``, каждая пачка в своей транзакции. Строки
+    с ошибками пропускаются и попадают в ``ImportResult.errors``.
+    При ``upsert=True`` существующие товары с тем же ``name``
+    обновляются через ``bulk_update`` вместо создания дублей.
+    """
     csv_file = TextIOWrapper(
         file,
-        encoding=request.encoding,
+        encoding=encoding or 'utf-8',
+        newline='',
     )
     reader = DictReader(csv_file)
+    fields = reader.fieldnames or []
+    unknown = set(fields) - set(CSV_IMPORT_FIELDS)
+    if unknown or 'name' not in fields:
+        raise ValidationError(
+            'CSV header must contain "name" and only columns from: %(allowed)s',
+            params={'allowed': ', '.join(CSV_IMPORT_FIELDS)},
+        )
+
+    result = ImportResult()
+    batch = []
+    for row in reader:
+        try:
+            batch.append(_clean_csv_row(row))
+        except ValidationError as exc:
+            result.add_error(reader.line_num, exc.message_dict)
+            continue
+        if len(batch) >= batch_size:
+            _write_products_batch(batch, fields, upsert, result)
+            batch = []
+    if batch:
+        _write_products_batch(batch, fields, upsert, result)
+    return result
+
+
+def add_products_to_order(order: Order, product_ids: Iterable[int]) -> int:
+    """
+    Добавляет товары в заказ одним INSERT в таблицу связи вместо
+    ``order.products.add()`` по одному, затем обновляет итоги заказа.
+
+    Несуществующие id пропускаются, уже добавленные товары не дублируются.
+    ``product_ids`` может быть и queryset'ом - тогда проверка идет
+    подзапросом, без выгрузки id в Python. Возвращает число товаров в заказе.
+    """
+    through = Order.products.through
+    with transaction.atomic():
+        through.objects.bulk_create(
+            [through(order_id=order.pk, product_id=product_id) for product_id in _existing_product_ids(product_ids)],
+            ignore_conflicts=True,
+        )
+        Order.objects.filter(pk=order.pk).refresh_totals()
+    order.refresh_from_db(fields=['total', 'products_count'])
+    return order.products_count
+
+
+def _existing_product_ids(product_ids: Iterable[int]) -> Iterator[int]:
+    if isinstance(product_ids, QuerySet):
+        yield from Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True).iterator()
+        return
+    yield from _values_in_batches(Product.objects.all(), 'pk', product_ids, 'pk', flat=True)
+
+
+def _values_in_batches(queryset: QuerySet, field: str, values: Iterable, *fields: str, flat: bool = False) -> Iterator:
+    """
+    ``values_list(*fields)`` строк, у которых ``field`` из ``values``:
+    запрос на каждые ``IN_LOOKUP_BATCH_SIZE`` значений.
+    """
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), IN_LOOKUP_BATCH_SIZE):
+        batch = values[start:start + IN_LOOKUP_BATCH_SIZE]
+        yield from queryset.filter(**{f'{field}__in': batch}).values_list(*fields, flat=flat)
+
+
+def _write_orders_batch(rows: list[dict], result: ImportResult):
+    """
+    Пишет пачку заказов: один bulk_create для заказов и один для
+    всех их строк. Итоги считаются заранее по ценам товаров.
+    """
+    users = dict(_values_in_batches(
+        User.objects.all(), 'username', (row['username'] for row in rows), 'username', 'pk',
+    ))
+    prices = dict(_values_in_batches(
+        Product.objects.all(), 'pk', (pk for row in rows for pk in row['products']), 'pk', 'price',
+    ))
+    orders = []
+    order_products = []
+    for row in rows:
+        errors = {}
+        if row['username'] not in users:
+            errors['username'] = [f'Unknown user {row["username"]!r}']
+        missing = [pk for pk in row['products'] if pk not in prices]
+        if missing:
+            errors['products'] = [f'Unknown products {missing}']
+        if errors:
+            result.add_error(row['line'], errors)
+            continue
+        orders.append(Order(
+            user_id=users[row['username']],
+            delivery_address=row['delivery_address'],
+            promocode=row['promocode'],
+            total=sum(prices[pk] for pk in row['products']),
+            products_count=len(row['products']),
+        ))
+        order_products.append(row['products'])
+
+    through = Order.products.through
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        through.objects.bulk_create(
+            through(order_id=order.pk, product_id=product_id)
+            for order, product_ids in zip(orders, order_products)
+            for product_id in product_ids
+        )
+    result.created += len(orders)
+
+
+def _parse_order_line(line: str) -> dict:
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    products = data.get('products', [])
+    if not isinstance(products, list) or not all(isinstance(pk, int) for pk in products):
+        raise ValueError('"products" must be a list of product ids')
+    return {
+        'username': str(data['username']),
+        'delivery_address': data.get('delivery_address') or '',
+        'promocode': data.get('promocode') or '',
+        # Товар входит в заказ один раз (уникальность в таблице связи).
+        'products': list(dict.fromkeys(products)),
+    }
+
+
+def import_orders(lines: Iterable[str], batch_size: int = ORDERS_IMPORT_BATCH_SIZE) -> ImportResult:
+    """
+    Импортирует заказы из JSON Lines, по объекту на строку::
+
+        {"username": "bob", "delivery_address": "...", "promocode": "", "products": [1, 2]}
 
-    products = [
-        Product(**row)
-        for row in reader
-    ]
-    Product.objects.bulk_create(products)
-    return products
+    Файл читается построчно, заказы пишутся пачками по ``batch_size``,
+    каждая в своей транзакции. Строки с ошибками пропускаются.
+    """
+    result = ImportResult()
+    batch = []
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = _parse_order_line(line)
+        except (ValueError, KeyError) as exc:
+            result.add_error(line_num, {NON_FIELD_ERRORS: [f'Invalid order: {exc}']})
+            continue
+        row['line'] = line_num
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _write_orders_batch(batch, result)
+            batch = []
+    if batch:
+        _write_orders_batch(batch, result)
+    return result
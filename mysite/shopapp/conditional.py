@@ -0,0 +1,49 @@
+"""
+Валидаторы условных GET (mysite.conditional) для страниц и API товаров.
+
+Валидаторы выборки считаются одним запросом ``MAX(updated_at)`` и
+``COUNT(*)``: ``updated_at`` меняется при любом изменении товара, в том
+числе через ``queryset.update()``, а число строк замечает удаления.
+Если версия у клиента актуальна, он получает 304 без выборки самих
+товаров и без рендеринга.
+"""
+from hashlib import md5
+
+from django.db.models import Count, Max, QuerySet
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
+
+from mysite.conditional import Validators
+
+
+def _aggregates() -> dict:
+    return {'last_modified': Max('updated_at'), 'count': Count('pk')}
+
+
+def _validators(stats: dict, variant: tuple) -> Validators:
+    last_modified = stats['last_modified']
+    # variant - то, от чего еще зависит ответ по тому же URL (формат).
+    raw = ':'.join((
+        str(stats['count']),
+        last_modified.isoformat() if last_modified else '',
+        get_language() or '',
+        *variant,
+    ))
+    return Validators(quote_etag(md5(raw.encode()).hexdigest()), last_modified, stats['count'])
+
+
+def product_validators(queryset: QuerySet, *variant: str) -> Validators:
+    stats = queryset.order_by().aggregate(**_aggregates())
+    return _validators(stats, variant)
+
+
+async def aproduct_validators(queryset: QuerySet, *variant: str) -> Validators:
+    stats = await queryset.order_by().aaggregate(**_aggregates())
+    return _validators(stats, variant)
+
+
+def instance_validators(instance, *variant: str) -> Validators:
+    """
+    Валидаторы одного уже загруженного товара - без запроса к базе.
+    """
+    return _validators({'last_modified': instance.updated_at, 'count': 1}, variant)
@@ -0,0 +1,321 @@
+"""
+Генератор синтетических данных большого объема: пользователи с
+профилями, товары, заказы с товарами и статьи блога.
+
+Данные пишутся пачками через ``bulk_create`` с заранее назначенными
+первичными ключами, поэтому заказы ссылаются на пользователей и товары
+без чтения их обратно из базы. Объекты пачки создаются до открытия
+транзакции: SQLite допускает одного пишущего, и при нескольких
+процессах под блокировкой проходит только сама запись.
+
+Содержимое каждой пачки, включая все даты, зависит только от ``seed``,
+конца истории ``end``, вида данных и номера первой строки: результат
+одинаковый и при последовательной записи, и при записи несколькими
+процессами.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from multiprocessing import Pool
+from random import Random
+from typing import Callable, Sequence
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import F, Max
+
+from blogapp.models import Article
+from myauth.models import Profile
+from .models import Order, Product
+from .search import drop_product_fts_triggers, install_product_fts
+
+DEFAULT_BATCH_SIZE = 5000
+GENERATED_PASSWORD = 'password'
+HISTORY_DAYS = 3 * 365
+# Конец истории по умолчанию. Все даты отсчитываются от фиксированного
+# момента, а не от текущего времени, иначе тот же ``seed`` в другой
+# день дал бы другие данные.
+DEFAULT_END = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+ADJECTIVES = (
+    'red', 'smart', 'compact', 'wireless', 'gaming', 'classic', 'pro', 'mini',
+    'ultra', 'portable', 'silent', 'ergonomic', 'premium', 'budget', 'vintage', 'eco',
+)
+NOUNS = (
+    'laptop', 'phone', 'monitor', 'keyboard', 'mouse', 'headset', 'tablet', 'camera',
+    'speaker', 'router', 'charger', 'printer', 'watch', 'drone', 'projector', 'console',
+)
+WORDS = ADJECTIVES + NOUNS + (
+    'with', 'and', 'for', 'battery', 'display', 'warranty', 'fast', 'light',
+    'metal', 'black', 'white', 'usb', 'bluetooth', 'hd', 'home', 'office',
+)
+FIRST_NAMES = ('Ivan', 'Anna', 'Petr', 'Olga', 'Sergey', 'Maria', 'Dmitry', 'Elena', 'Alexey', 'Irina')
+LAST_NAMES = ('Ivanov', 'Petrova', 'Sidorov', 'Smirnova', 'Kuznetsov', 'Popova', 'Volkov', 'Sokolova')
+STREETS = ('Lenina', 'Mira', 'Gagarina', 'Pushkina', 'Sadovaya', 'Lesnaya', 'Shkolnaya', 'Sovetskaya')
+PROMOCODES = ('', '', '', '', 'SALE10', 'WELCOME', 'BLACKFRIDAY', 'FREESHIP')
+
+
+class GenerationPlan:
+    """
+    Что и сколько генерировать и с каких первичных ключей начинать.
+
+    Если пользователи или товары не генерируются, заказы ссылаются
+    на уже существующие.
+    """
+
+    def __init__(
+            self,
+            users: int,
+            products: int,
+            orders: int,
+            articles: int,
+            seed: int,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            max_order_products: int = 20,
+            end: datetime | None = None,
+    ):
+        self.counts = {
+            'users': users,
+            'products': products,
+            'orders': orders,
+            'articles': articles,
+        }
+        self.seed = seed
+        self.batch_size = batch_size
+        self.max_order_products = max_order_products
+        self.end = end or DEFAULT_END
+        self.password = make_password(GENERATED_PASSWORD, salt=f'seed{seed}')
+
+        self.bases = {
+            'users': _next_pk(User),
+            'profiles': _next_pk(Profile),
+            'products': _next_pk(Product),
+            'orders': _next_pk(Order),
+            'articles': _next_pk(Article),
+        }
+        self.user_ids = self._ids('users', User)
+        self.product_ids = self._ids('products', Product)
+
+    def _ids(self, kind: str, model) -> Sequence[int]:
+        if self.counts[kind]:
+            return range(self.bases[kind], self.bases[kind] + self.counts[kind])
+        return list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+    def batches(self, kind: str) -> list[tuple[int, int]]:
+        count = self.counts[kind]
+        return [
+            (start, min(self.batch_size, count - start))
+            for start in range(0, count, self.batch_size)
+        ]
+
+    def random(self, kind: str, start: int) -> Random:
+        return Random(f'{self.seed}:{kind}:{start}')
+
+    def moment(self, rng: Random) -> datetime:
+        return self.end - timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 3600))
+
+
+def _next_pk(model) -> int:
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Временно отключает ``auto_now_add`` у ``created_at`` и ``auto_now``
+    у ``updated_at``, чтобы сохранить сгенерированные даты вместо
+    текущего времени.
+    """
+    fields = [
+        (field, attname)
+        for model in models
+        for name, attname in (('created_at', 'auto_now_add'), ('updated_at', 'auto_now'))
+        for field in model._meta.fields
+        if field.name == name
+    ]
+    for field, attname in fields:
+        setattr(field, attname, False)
+    try:
+        yield
+    finally:
+        for field, attname in fields:
+            setattr(field, attname, True)
+
+
+def write_users(plan: GenerationPlan, start: int, size: int):
+    rng = plan.random('users', start)
+    users = []
+    profiles = []
+    for i in range(start, start + size):
+        pk = plan.bases['users'] + i
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        users.append(User(
+            pk=pk,
+            username=f'user{pk}',
+            email=f'user{pk}@example.com',
+            first_name=first_name,
+            last_name=last_name,
+            password=plan.password,
+            date_joined=plan.moment(rng),
+        ))
+        profiles.append(Profile(
+            pk=plan.bases['profiles'] + i,
+            user_id=pk,
+            bio=' '.join(rng.choices(WORDS, k=rng.randint(0, 30))),
+            agreement_accepted=rng.random() < 0.9,
+        ))
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        Profile.objects.bulk_create(profiles)
+
+
+def write_products(plan: GenerationPlan, start: int, size: int):
+    rng = plan.random('products', start)
+    products = [
+        Product(
+            pk=plan.bases['products'] + i,
+            name=f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(NOUNS)} {plan.bases["products"] + i}',
+            description=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+            # Логнормальное распределение: много дешевых товаров, мало дорогих.
+            price=Decimal(f'{min(rng.lognormvariate(4, 1.2), 99999.99):.2f}'),
+            discount=rng.choice((0, 0, 0, 0, 5, 10, 15, 25, 50)),
+            created_at=plan.moment(rng),
+            archived=rng.random() < 0.05,
+        )
+        for i in range(start, start + size)
+    ]
+    for product in products:
+        product.updated_at = product.created_at
+    Product.objects.bulk_create(products)
+
+
+def write_orders(plan: GenerationPlan, start: int, size: int):
+    rng = plan.random('orders', start)
+    user_ids = plan.user_ids
+    product_ids = plan.product_ids
+    max_products = min(plan.max_order_products, len(product_ids))
+    orders = []
+    lines = []
+    for i in range(start, start + size):
+        pk = plan.bases['orders'] + i
+        order = Order(
+            pk=pk,
+            user_id=user_ids[rng.randrange(len(user_ids))],
+            delivery_address=f'ul {rng.choice(STREETS)}, d {rng.randint(1, 120)}, kv {rng.randint(1, 300)}',
+            promocode=rng.choice(PROMOCODES),
+            created_at=plan.moment(rng),
+        )
+        order.updated_at = order.created_at
+        orders.append(order)
+        # Обычно в заказе 1-3 товара, изредка десятки; популярные
+        # товары (с меньшим индексом) попадают в заказы чаще.
+        count = min(max_products, 1 + int(rng.expovariate(0.5)))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(product_ids[int(len(product_ids) * rng.random() ** 3)])
+        lines.extend(Order.products.through(order_id=pk, product_id=product_id) for product_id in chosen)
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        Order.products.through.objects.bulk_create(lines)
+        orders_batch = Order.objects.filter(pk__range=(orders[0].pk, orders[-1].pk))
+        orders_batch.refresh_totals(updated_at=F('created_at'))
+
+
+def write_articles(plan: GenerationPlan, start: int, size: int):
+    rng = plan.random('articles', start)
+    articles = []
+    for i in range(start, start + size):
+        paragraphs = (
+            ' '.join(rng.choices(WORDS, k=rng.randint(40, 120))).capitalize() + '.'
+            for _ in range(rng.randint(2, 8))
+        )
+        article = Article(
+            pk=plan.bases['articles'] + i,
+            title=' '.join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize(),
+            body='\n\n'.join(paragraphs),
+            published_at=plan.moment(rng) if rng.random() < 0.9 else None,
+        )
+        # Черновики считаются измененными в конце истории.
+        article.updated_at = article.published_at or plan.end
+        articles.append(article)
+    Article.objects.bulk_create(articles)
+
+
+WRITERS = {
+    'users': write_users,
+    'products': write_products,
+    'orders': write_orders,
+    'articles': write_articles,
+}
+
+_plan: GenerationPlan | None = None
+
+
+def _set_plan(plan: GenerationPlan):
+    global _plan
+    _plan = plan
+
+
+def _init_worker(plan: GenerationPlan):
+    if not apps.ready:
+        import django
+        django.setup()
+    # Процессы пишут в SQLite по очереди, пусть ждут блокировку дольше.
+    connection.settings_dict.setdefault('OPTIONS', {}).setdefault('timeout', 120)
+    _set_plan(plan)
+
+
+def run_batch(task: tuple[str, int, int]) -> tuple[str, int]:
+    kind, start, size = task
+    with explicit_timestamps(Product, Order, Article):
+        WRITERS[kind](_plan, start, size)
+    return kind, size
+
+
+def generate(
+        plan: GenerationPlan,
+        workers: int = 1,
+        progress: Callable[[str, int, int], None] | None = None,
+) -> dict[str, int]:
+    """
+    Записывает данные по плану: сначала пользователи и товары, затем
+    заказы, которые на них ссылаются, и статьи. При ``workers > 1``
+    пачки каждого этапа пишут несколько процессов.
+    """
+    written = {}
+    if plan.counts['products']:
+        drop_product_fts_triggers(connection)
+    try:
+        for kinds in (('users', 'products', 'articles'), ('orders',)):
+            tasks = [
+                (kind, start, size)
+                for kind in kinds
+                for start, size in plan.batches(kind)
+            ]
+            for kind, size in _run_tasks(plan, tasks, workers):
+                written[kind] = written.get(kind, 0) + size
+                if progress:
+                    progress(kind, written[kind], plan.counts[kind])
+    finally:
+        install_product_fts(connection, create=False)
+
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Profile, Product, Order, Article]):
+            cursor.execute(sql)
+    return written
+
+
+def _run_tasks(plan: GenerationPlan, tasks: list, workers: int):
+    if workers <= 1 or len(tasks) <= 1:
+        _set_plan(plan)
+        for task in tasks:
+            yield run_batch(task)
+        return
+    # Дочерние процессы не должны унаследовать открытое соединение.
+    connections.close_all()
+    with Pool(workers, initializer=_init_worker, initargs=(plan,)) as pool:
+        yield from pool.imap_unordered(run_batch, tasks)
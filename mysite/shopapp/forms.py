@@ -30,6 +30,10 @@ class ProductForm(forms.ModelForm):
 
 class CSVImportForm(forms.Form):
     csv_file = forms.FileField()
+    upsert = forms.BooleanField(
+        required=False,
+        label='Update existing products with the same name',
+    )
 
 
 class GroupForm(forms.ModelForm):
@@ -0,0 +1,152 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from requestdataapp.metrics import registry
+
+from shopapp.benchmarks import (
+    SCENARIOS,
+    benchmark_serializers,
+    benchmark_templates,
+    compare_results,
+    format_table,
+    run_benchmarks,
+    seed_dataset,
+)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[3] / 'benchmarks' / 'baseline.json'
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+        # По умолчанию 300 ключей: фрагменты списка на 1000 элементов
+        # вытесняли бы друг друга.
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    }
+}
+NO_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+class Command(BaseCommand):
+    """
+    Замеряет основные страницы и API на сгенерированных данных.
+
+    Прогон идет во временной тестовой базе, кеш подменяется на
+    локальный, рабочие база и кеш не затрагиваются.
+    """
+    help = 'Benchmark key endpoints in-process and compare with a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--articles', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=sorted(SCENARIOS),
+            help='Run only this scenario (can be repeated)',
+        )
+        parser.add_argument(
+            '--with-cache',
+            action='store_true',
+            help='Measure with a local memory cache instead of no cache',
+        )
+        parser.add_argument(
+            '--serializers',
+            action='store_true',
+            help='Only compare ProductSerializer with the values() fast path (rows per second)',
+        )
+        parser.add_argument(
+            '--templates',
+            action='store_true',
+            help='Only measure list templates per 1000 items without and with the fragment cache',
+        )
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument(
+            '--compare',
+            nargs='?',
+            const=str(DEFAULT_BASELINE),
+            help=f'Fail if results regress against a baseline (default {DEFAULT_BASELINE})',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Allowed latency slowdown as a fraction of the baseline',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            nargs='?',
+            const=str(DEFAULT_BASELINE),
+            help='Store results as the new baseline',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Запросы прогона не должны попасть в метрики рабочих воркеров.
+        metrics_dir = TemporaryDirectory()
+        production_metrics_dir, registry.directory = registry.directory, Path(metrics_dir.name)
+        try:
+            # Кэшу фрагментов в шаблонах нужен настоящий кэш.
+            use_cache = options['with_cache'] or options['templates']
+            with override_settings(CACHES=BENCHMARK_CACHES if use_cache else NO_CACHES):
+                data = seed_dataset(
+                    products=options['products'],
+                    orders=options['orders'],
+                    articles=options['articles'],
+                    seed=options['seed'],
+                )
+                if options['serializers']:
+                    serializers = benchmark_serializers(rows=options['products'], repeat=options['iterations'])
+                    self.stdout.write(json.dumps(serializers, indent=2))
+                    return
+                if options['templates']:
+                    templates = benchmark_templates(items=1000, repeat=options['iterations'])
+                    self.stdout.write(json.dumps(templates, indent=2))
+                    return
+                results = run_benchmarks(
+                    data,
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    names=options['scenario'],
+                )
+        finally:
+            registry.directory = production_metrics_dir
+            metrics_dir.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        results['meta']['cache'] = options['with_cache']
+
+        self.stdout.write(format_table(results))
+        for option in ('output', 'save_baseline'):
+            if options[option]:
+                path = Path(options[option])
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(results, indent=2) + '\n')
+                self.stdout.write(f'Results written to {path}')
+
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text())
+            mismatched = [
+                key for key in ('products', 'orders', 'articles', 'cache')
+                if baseline['meta'].get(key) != results['meta'][key]
+            ]
+            if mismatched:
+                raise CommandError(f'Baseline was recorded with different {", ".join(mismatched)}')
+            regressions = compare_results(results, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(f'  ! {regression}'))
+                raise CommandError(f'{len(regressions)} benchmark regressions against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -1,9 +1,8 @@
-from typing import Sequence
-
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from django.db import transaction
 
+from shopapp.common import add_products_to_order
 from shopapp.models import Order, Product
 
 
@@ -12,14 +11,12 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write("Create order")
         user = User.objects.get(username="admin")
-        products: Sequence[Product] = Product.objects.only('id').all()
+        product_ids = Product.objects.values_list('pk', flat=True)
         order, created = Order.objects.get_or_create(
             delivery_address="ul Ivanova, d 8",
             promocode="promo5",
             user=user
         )
 
-        for product in products:
-            order.products.add(product)
-        order.save()
+        add_products_to_order(order, product_ids)
         self.stdout.write(f'Created order {order}')
@@ -0,0 +1,79 @@
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Q
+
+from blogapp.models import Article
+from shopapp.models import Order, Product
+
+
+def main_querysets():
+    """
+    Основные запросы shopapp и blogapp: (название, queryset, ожидается ли полный проход).
+
+    Полный проход ожидаем только там, где по смыслу читается вся таблица.
+    """
+    keyset_after = Q(name__lte='M') & (
+        Q(name__lt='M')
+        | Q(name='M', price__gt=100)
+        | Q(name='M', price=100, pk__gt=1)
+    )
+    return [
+        ('ProductListView', Product.objects.filter(archived=False), False),
+        ('ProductViewSet.list', Product.objects.all(), False),
+        ('ProductViewSet.list ?ordering=price', Product.objects.order_by('price'), False),
+        ('ProductViewSet.list ?ordering=-discount', Product.objects.order_by('-discount'), False),
+        ('ProductViewSet.list ?name=', Product.objects.filter(name='Laptop'), False),
+        ('ProductViewSet.list ?archived=', Product.objects.filter(archived=True), True),
+        ('ProductViewSet.list ?cursor=', Product.objects.filter(keyset_after).order_by('-name', 'price', 'pk'), False),
+        ('ProductDetailView', Product.objects.filter(pk=1), False),
+        ('ProductsDataExportView', Product.objects.order_by('pk').values_list('pk', 'name', 'price', 'archived'), True),
+        ('OrderListView', Order.objects.select_related('user'), True),
+        ('Orders of product', Order.objects.filter(products__pk=1), False),
+        ('ArticleListView', Article.objects.published().defer('body'), False),
+        ('LatestArticlesFeed validators', Article.objects.published().values_list('pk', 'updated_at')[:5], False),
+    ]
+
+
+def plan_warnings(plan: str) -> list[str]:
+    warnings = []
+    for line in plan.splitlines():
+        detail = line.split(maxsplit=3)[-1] if line[:1].isdigit() else line
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            warnings.append(f'full scan: {detail}')
+        if 'USE TEMP B-TREE' in detail:
+            warnings.append(f'temp b-tree sort: {detail}')
+    return warnings
+
+
+class Command(BaseCommand):
+    """
+    Выводит EXPLAIN QUERY PLAN для основных запросов shopapp
+    и помечает полные проходы таблиц и сортировки во временном B-tree.
+    """
+    help = 'Show query plans of the main shop and blog querysets and flag full scans and temp sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-warning',
+            action='store_true',
+            help='Exit with an error if an unexpected full scan or temp sort is found',
+        )
+
+    def handle(self, *args, **options):
+        flagged = []
+        for name, queryset, scan_expected in main_querysets():
+            plan = queryset.explain()
+            warnings = plan_warnings(plan)
+            if scan_expected:
+                warnings = [warning for warning in warnings if not warning.startswith('full scan')]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            for warning in warnings:
+                self.stdout.write(self.style.WARNING(f'  ! {warning}'))
+            if warnings:
+                flagged.append(name)
+
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS('No full scans or temp sorts found'))
+        elif options['fail_on_warning']:
+            raise CommandError(f'Query plan regressions in: {", ".join(flagged)}')
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+
+from shopapp.models import Product, ProductImage
+from shopapp.renditions import generate_renditions, get_renditions
+
+
+class Command(BaseCommand):
+    """
+    Делает уменьшенные копии для уже загруженных изображений товаров.
+    """
+    help = 'Generate srcset renditions of product previews and images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Skip images that already have renditions',
+        )
+
+    def handle(self, *args, **options):
+        names = [
+            *Product.objects.exclude(preview='').exclude(preview__isnull=True).values_list('preview', flat=True),
+            *ProductImage.objects.exclude(image='').values_list('image', flat=True),
+        ]
+        generated = failed = 0
+        for name in names:
+            if options['missing'] and get_renditions(name):
+                continue
+            try:
+                generate_renditions(name)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f'{name}: {exc}')
+                continue
+            generated += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {generated} images, {failed} failed'))
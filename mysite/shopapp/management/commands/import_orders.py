@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.common import ORDERS_IMPORT_BATCH_SIZE, import_orders
+
+
+class Command(BaseCommand):
+    """
+    Импортирует заказы из файла JSON Lines, по заказу на строку::
+
+        {"username": "bob", "delivery_address": "ul Ivanova, d 8", "promocode": "", "products": [1, 2]}
+    """
+    help = 'Import orders from a JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .jsonl file')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ORDERS_IMPORT_BATCH_SIZE,
+            help='Orders per transaction',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Import orders from {options["path"]}')
+        try:
+            with open(options['path'], encoding='utf-8') as file:
+                result = import_orders(file, batch_size=options['batch_size'])
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for line, errors in result.errors:
+            self.stdout.write(self.style.WARNING(f'Line {line} skipped: {errors}'))
+        self.stdout.write(
+            self.style.SUCCESS(f'Imported {result.created} orders, skipped {result.skipped} lines')
+        )
@@ -0,0 +1,67 @@
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Count, F, Q, Sum
+
+from shopapp.models import Order
+
+
+class Command(BaseCommand):
+    """
+    Сверяет или пересчитывает денормализованные Order.total и Order.products_count.
+    """
+    help = 'Verify or backfill materialized order totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Recompute totals of all orders',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Orders per UPDATE when backfilling',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill(options['batch_size'])
+        self.verify()
+
+    def backfill(self, batch_size: int):
+        self.stdout.write('Backfill order totals')
+        last_pk = 0
+        updated = 0
+        while True:
+            pks = list(
+                Order.objects
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            updated += Order.objects.filter(pk__in=pks).refresh_totals()
+            last_pk = pks[-1]
+        self.stdout.write(f'Updated {updated} orders')
+
+    def verify(self):
+        mismatched = (
+            Order.objects
+            .annotate(
+                actual_total=Sum('products__price', default=0),
+                actual_count=Count('products'),
+            )
+            .filter(~Q(total=F('actual_total')) | ~Q(products_count=F('actual_count')))
+            .values_list('pk', 'total', 'actual_total', 'products_count', 'actual_count')
+        )
+        found = 0
+        for pk, total, actual_total, count, actual_count in mismatched.iterator():
+            found += 1
+            self.stdout.write(
+                f'Order #{pk}: total {total} != {actual_total} '
+                f'or products_count {count} != {actual_count}'
+            )
+        if found:
+            raise CommandError(f'{found} orders have stale totals, run with --backfill')
+        self.stdout.write(self.style.SUCCESS('Order totals are up to date'))
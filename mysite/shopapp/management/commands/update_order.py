@@ -1,5 +1,6 @@
 from django.core.management import BaseCommand
 
+from shopapp.common import add_products_to_order
 from shopapp.models import Order, Product
 
 
@@ -8,13 +9,13 @@ class Command(BaseCommand):
         order = Order.objects.first()
         if not order:
             self.stdout.write('Order was not found')
-        products = Product.objects.all()
-        for product in products:
-            order.products.add(product)
+            return
+        product_ids = Product.objects.values_list('pk', flat=True)
+        products_count = add_products_to_order(order, product_ids)
 
-        order.save()
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully added products {order.products.all()} to order {order}'
+                f'Successfully added products to order {order}, '
+                f'now {products_count} products worth {order.total}'
             )
         )
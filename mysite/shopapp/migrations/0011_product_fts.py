@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from shopapp.search import install_product_fts, uninstall_product_fts
+
+
+def create_product_fts(apps, schema_editor):
+    install_product_fts(schema_editor.connection)
+
+
+def drop_product_fts(apps, schema_editor):
+    uninstall_product_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0010_alter_product_description_alter_product_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_fts, drop_product_fts),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+from shopapp.search import install_product_fts
+
+
+def restore_product_fts(apps, schema_editor):
+    # AlterField на SQLite пересоздает таблицу вместе с триггерами FTS.
+    install_product_fts(schema_editor.connection, create=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0011_product_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-name', 'price'], name='shopapp_product_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('archived', False)), fields=['-name', 'price'], name='shopapp_product_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='shopapp_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount'], name='shopapp_product_discount_idx'),
+        ),
+        migrations.RunPython(restore_product_fts, migrations.RunPython.noop),
+    ]
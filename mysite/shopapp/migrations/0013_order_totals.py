@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-18 16:44
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('shopapp', 'Order')
+    lines = (
+        Order.products.through.objects
+        .filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+    )
+    Order.objects.update(
+        total=Coalesce(
+            Subquery(lines.annotate(total=Sum('product__price')).values('total')),
+            Value(0),
+            output_field=DecimalField(),
+        ),
+        products_count=Coalesce(
+            Subquery(lines.annotate(count=Count('pk')).values('count')),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0012_product_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 17:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+from shopapp.search import install_product_fts
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Точное время изменений старых товаров неизвестно, берем время создания.
+    Product = apps.get_model('shopapp', 'Product')
+    Product.objects.update(updated_at=F('created_at'))
+
+
+def restore_product_fts(apps, schema_editor):
+    # AddField на SQLite пересоздает таблицу вместе с триггерами FTS.
+    install_product_fts(schema_editor.connection, create=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0014_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='shopapp_product_updated_idx'),
+        ),
+        migrations.RunPython(restore_product_fts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,10 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import PRODUCT_DETAILS_BUMP_LIMIT, bump_products_version, invalidate_product_details
 
 def product_preview_directory_path(instance: "Product", filename: str) -> str:
     return 'product/product_{pk}/preview/{filename}'.format(
@@ -7,6 +12,62 @@ def product_preview_directory_path(instance: "Product", filename: str) -> str:
         filename=filename,
     )
 
+class ProductQuerySet(models.QuerySet):
+    """
+    Массовые операции не шлют post_save, поэтому версии кэша
+    товаров и отдельных товаров меняются здесь. ``auto_now`` они
+    тоже не применяют - ``updated_at`` проставляется явно.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        order_ids = self._order_ids() if 'price' in kwargs else None
+        # pk до обновления: оно может вывести строки из выборки. Больше
+        # лимита не читаем - тогда сбрасывается кэш всех товаров.
+        pks = list(self.order_by().values_list('pk', flat=True)[:PRODUCT_DETAILS_BUMP_LIMIT + 1])
+        rows = super().update(**kwargs)
+        if rows:
+            bump_products_version()
+            invalidate_product_details(pks)
+        if order_ids:
+            Order.objects.filter(pk__in=order_ids).refresh_totals()
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        if objs:
+            bump_products_version()
+            # Для этих pk мог быть закэширован «товара нет».
+            invalidate_product_details(obj.pk for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'updated_at' not in fields:
+            now = timezone.now()
+            for obj in objs:
+                obj.updated_at = now
+            fields = [*fields, 'updated_at']
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            bump_products_version()
+            invalidate_product_details(obj.pk for obj in objs)
+        if rows and 'price' in fields:
+            product_ids = [obj.pk for obj in objs]
+            Order.objects.filter(products__in=product_ids).refresh_totals()
+        return rows
+
+    def _order_ids(self) -> list[int]:
+        through = self.model.orders.through
+        return list(
+            through.objects
+            .filter(product__in=self.values('pk'))
+            .values_list('order_id', flat=True)
+            .distinct()
+        )
+
+
 # Create your models here.
 class Product(models.Model):
     """
@@ -20,15 +81,43 @@ class Product(models.Model):
         ordering = ['-name','price']
         #db_table = 'tech_products'
         #verbose_name = 'products'
+        indexes = [
+            # Порядок по умолчанию; префикс name обслуживает и фильтр по name.
+            models.Index(fields=['-name', 'price'], name='shopapp_product_order_idx'),
+            # Витрина: только активные товары в порядке по умолчанию.
+            models.Index(
+                fields=['-name', 'price'],
+                condition=models.Q(archived=False),
+                name='shopapp_product_active_idx',
+            ),
+            # Сортировки API (?ordering=price / discount) и keyset-курсор по ним.
+            models.Index(fields=['price'], name='shopapp_product_price_idx'),
+            models.Index(fields=['discount'], name='shopapp_product_discount_idx'),
+            # MAX(updated_at) для условных GET - по индексу, без прохода по таблице.
+            models.Index(fields=['updated_at'], name='shopapp_product_updated_idx'),
+        ]
 
-    name = models.CharField(max_length=100, db_index=True)
-    description = models.TextField(null=False, blank=True,db_index=True)
+    name = models.CharField(max_length=100)
+    description = models.TextField(null=False, blank=True)
     price = models.DecimalField(default=0, max_digits=10, decimal_places=2)
     discount = models.SmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется при любом изменении товара и его картинок, в том числе
+    # через queryset.update(); по нему считаются ETag и Last-Modified.
+    updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_directory_path)
 
+    objects = ProductQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужна, чтобы при сохранении пересчитать суммы заказов
+        # только если цена действительно изменилась.
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
     # @property
     # def description_short(self) -> str:
     #     if len(self.description) < 48:
@@ -52,10 +141,67 @@ class ProductImage(models.Model):
     image = models.ImageField(upload_to=product_preview_directory_path)
     description = models.CharField(max_length=200, null=False, blank=True)
 
+class OrderQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Итоги пересчитываются через update(): отметка времени
+        # меняется вместе с ними, как и при save() через auto_now.
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def refresh_totals(self, **extra) -> int:
+        """
+        Пересчитывает ``total`` и ``products_count`` выбранных заказов
+        одним UPDATE с подзапросом по их строкам. ``extra`` - другие
+        поля того же UPDATE.
+        """
+        lines = (
+            Order.products.through.objects
+            .filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+        )
+        total = lines.annotate(total=Sum('product__price')).values('total')
+        count = lines.annotate(count=Count('pk')).values('count')
+        return self.update(
+            total=Coalesce(Subquery(total), Value(0), output_field=DecimalField()),
+            products_count=Coalesce(Subquery(count), Value(0)),
+            **extra,
+        )
+
+    refresh_totals.alters_data = True
+
+    def add_to_totals(self, total, products_count: int) -> int:
+        return self.update(
+            total=F('total') + total,
+            products_count=F('products_count') + products_count,
+        )
+
+    add_to_totals.alters_data = True
+
+
 class Order(models.Model):
+    class Meta:
+        indexes = [
+            # Лента заказов API: новые первыми, keyset-курсор по (created_at, id).
+            models.Index(fields=['-created_at', '-id'], name='shopapp_order_created_idx'),
+            # Заказы одного пользователя с фильтром по дате.
+            models.Index(fields=['user', '-created_at', '-id'], name='shopapp_order_user_created_idx'),
+        ]
+
     delivery_address = models.TextField(null=True, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется при сохранении и при пересчете итогов (состав заказа,
+    # цены товаров); входит в ключ кэша карточки заказа в шаблоне.
+    updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name='orders')
-    receipt = models.FileField(null=True, upload_to='orders/receipts')
\ No newline at end of file
+    receipt = models.FileField(null=True, upload_to='orders/receipts')
+    # Денормализованные итоги по products; их поддерживают сигналы
+    # в shopapp.signals, сверить и пересчитать: manage.py order_totals.
+    total = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    products_count = models.PositiveIntegerField(default=0)
+
+    objects = OrderQuerySet.as_manager()
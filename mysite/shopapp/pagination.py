@@ -0,0 +1,124 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset-пагинация: следующая страница выбирается условием
+    «после последней строки предыдущей», а не через OFFSET.
+
+    Порядок берется из запроса (например, после ``OrderingFilter``)
+    или из ``Meta.ordering`` модели, к нему всегда добавляется ``pk``
+    для однозначности. Курсор хранит значения полей порядка последней
+    строки, поэтому каждая страница - это один индексный проход без
+    ``COUNT(*)``, как бы далеко клиент ни ушел. Пагинация только вперед.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_keyset_ordering(queryset)
+        self.fields = [
+            self._get_field(queryset, term.lstrip('-'))
+            for term in self.ordering
+        ]
+
+        position = self.decode_position(request)
+        if position is not None:
+            queryset = queryset.filter(self.build_after_filter(position))
+
+        results = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        self.has_previous = False
+        self.next_position = None
+        if self.has_next:
+            last = self.page[-1]
+            self.next_position = [
+                getattr(last, term.lstrip('-'))
+                for term in self.ordering
+            ]
+        return self.page
+
+    def get_keyset_ordering(self, queryset: QuerySet) -> list[str]:
+        ordering = [
+            term for term in (queryset.query.order_by or queryset.model._meta.ordering)
+            if isinstance(term, str)
+        ]
+        names = {term.lstrip('-') for term in ordering}
+        if not names & {'pk', queryset.model._meta.pk.name}:
+            ordering.append('pk')
+        return ordering
+
+    def _get_field(self, queryset: QuerySet, name: str):
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def build_after_filter(self, position: list) -> Q:
+        condition = Q()
+        equal = Q()
+        for term, value in zip(self.ordering, position):
+            name = term.lstrip('-')
+            lookup = 'lt' if term.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        # Избыточная граница по первому полю позволяет СУБД начать
+        # с нужного места индекса, а не проходить его с начала.
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def decode_position(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(raw, list) or len(raw) != len(self.fields):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for field, value in zip(self.fields, raw)
+            ]
+        except (BinasciiError, UnicodeError, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_position(self, position: list) -> str:
+        # Decimal и datetime кладем строкой целиком: DjangoJSONEncoder
+        # обрезает микросекунды, и курсор перестал бы быть точным.
+        position = [
+            value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+            for value in position
+        ]
+        raw = json.dumps(position, separators=(',', ':'))
+        return urlsafe_b64encode(raw.encode()).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_position(self.next_position),
+        )
+
+    def get_previous_link(self):
+        return None
@@ -0,0 +1,195 @@
+"""
+Уменьшенные копии изображений товаров для ``srcset``.
+
+Для каждого загруженного ``Product.preview`` и ``ProductImage.image``
+рядом с оригиналом сохраняются копии нескольких ширин в исходном
+формате (JPEG, либо PNG для картинок с прозрачностью) и в WebP, а
+также манифест ``<имя>.renditions.json`` со списком копий. Манифест
+пишется последним: пока его нет, шаблоны и API отдают только оригинал.
+
+Копии делаются в отдельном пуле процессов после коммита транзакции,
+поэтому запрос с загрузкой файла не ждет Pillow.
+"""
+import json
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from hashlib import md5
+from io import BytesIO
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+log = logging.getLogger(__name__)
+
+RENDITIONS_CACHE_TIMEOUT = 24 * 60 * 60
+# Манифеста еще нет (копии в работе) - проверяем снова через минуту.
+MISSING_RENDITIONS_CACHE_TIMEOUT = 60
+JPEG_OPTIONS = {'quality': 82, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'optimize': True}
+WEBP_OPTIONS = {'quality': 80, 'method': 4}
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def rendition_widths() -> tuple[int, ...]:
+    return tuple(sorted(getattr(settings, 'IMAGE_RENDITION_WIDTHS', (160, 320, 640))))
+
+
+def rendition_name(name: str, width: int, extension: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f'{root}.{width}w.{extension}'
+
+
+def manifest_name(name: str) -> str:
+    root, _ = os.path.splitext(name)
+    return f'{root}.renditions.json'
+
+
+def _renditions_cache_key(name: str) -> str:
+    # Имя файла может содержать пробелы и быть длинным - в ключ кладем хэш.
+    return f'shopapp:renditions:{md5(name.encode()).hexdigest()}'
+
+
+def _save(storage, name: str, content: bytes) -> str:
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def _encode(image: Image.Image, image_format: str, options: dict) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(name: str, storage=None) -> dict:
+    """
+    Делает копии изображения ``name`` и пишет манифест.
+
+    Копии шире оригинала не делаются: вместо них одна копия
+    в исходную ширину, только перекодированная.
+    """
+    storage = storage or default_storage
+    with storage.open(name) as file, Image.open(file) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback_format, fallback_extension, fallback_options = (
+        ('PNG', 'png', PNG_OPTIONS) if has_alpha else ('JPEG', 'jpg', JPEG_OPTIONS)
+    )
+
+    widths = rendition_widths()
+    targets = [width for width in widths if width < image.width]
+    if image.width <= widths[-1]:
+        targets.append(image.width)
+
+    renditions = []
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        renditions.append({
+            'width': width,
+            'height': height,
+            'fallback': _save(
+                storage,
+                rendition_name(name, width, fallback_extension),
+                _encode(resized, fallback_format, fallback_options),
+            ),
+            'webp': _save(storage, rendition_name(name, width, 'webp'), _encode(resized, 'WEBP', WEBP_OPTIONS)),
+        })
+
+    manifest = {'width': image.width, 'height': image.height, 'renditions': renditions}
+    _save(storage, manifest_name(name), json.dumps(manifest).encode())
+    cache.delete(_renditions_cache_key(name))
+    _touch_products(name)
+    return manifest
+
+
+def _touch_products(name: str):
+    # В ответах появился srcset: обновляем updated_at товаров с этой
+    # картинкой, чтобы сменились их ETag и версия кэша.
+    from .models import Product
+
+    Product.objects.filter(Q(preview=name) | Q(images__image=name)).update(updated_at=timezone.now())
+
+
+def get_renditions(name: str) -> dict | None:
+    """
+    Манифест копий изображения или ``None``, если копий еще нет.
+    """
+    if not name:
+        return None
+    key = _renditions_cache_key(name)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with default_storage.open(manifest_name(name)) as file:
+                manifest = json.loads(file.read())
+        except (OSError, ValueError):
+            manifest = {}
+        cache.set(key, manifest, RENDITIONS_CACHE_TIMEOUT if manifest else MISSING_RENDITIONS_CACHE_TIMEOUT)
+    return manifest or None
+
+
+def build_srcset(manifest: dict, key: str, absolute_uri=None) -> str:
+    """
+    ``srcset`` для ``key`` (``'fallback'`` или ``'webp'``);
+    ``absolute_uri`` - например, ``request.build_absolute_uri``.
+    """
+    candidates = []
+    for rendition in manifest['renditions']:
+        url = default_storage.url(rendition[key])
+        if absolute_uri is not None:
+            url = absolute_uri(url)
+        candidates.append(f'{url} {rendition["width"]}w')
+    return ', '.join(candidates)
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _log_failure(name: str, future: Future):
+    exception = future.exception()
+    if exception is not None:
+        log.error('Image renditions of %s failed', name, exc_info=exception)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: воркер ASGI многопоточный, а fork из
+        # многопоточного процесса может унаследовать захваченные локи.
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+            mp_context=get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _submit(name: str):
+    if getattr(settings, 'IMAGE_RENDITIONS_SYNC', False):
+        generate_renditions(name)
+        return
+    future = _get_executor().submit(generate_renditions, name)
+    future.add_done_callback(lambda done: _log_failure(name, done))
+
+
+def schedule_renditions(name: str):
+    """
+    Ставит изготовление копий в очередь после коммита: к этому
+    моменту файл уже сохранен, а запись в базе видна другим процессам.
+    """
+    transaction.on_commit(lambda: _submit(name))
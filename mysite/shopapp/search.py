@@ -0,0 +1,168 @@
+"""
+Полнотекстовый поиск по товарам на SQLite FTS5.
+
+Индекс ``shopapp_product_fts`` - это FTS5-таблица с внешним содержимым
+поверх ``shopapp_product``. Триггеры держат ее в актуальном состоянии
+при любых изменениях, в том числе через ``queryset.update()`` и
+``bulk_create()``. Результаты ранжируются функцией bm25.
+
+На других СУБД ``search_products`` возвращает ``None``, и вызывающий
+код откатывается на обычный поиск через LIKE.
+"""
+from typing import Iterable
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import FloatField, QuerySet
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+PRODUCT_FTS_TABLE = 'shopapp_product_fts'
+# Веса колонок для bm25: совпадение в названии важнее, чем в описании.
+PRODUCT_FTS_WEIGHTS = (10.0, 1.0)
+
+_PRODUCT_FTS_TRIGGERS = {
+    'shopapp_product_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_ai AFTER INSERT ON shopapp_product BEGIN
+            INSERT INTO shopapp_product_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+    'shopapp_product_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_ad AFTER DELETE ON shopapp_product BEGIN
+            INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    'shopapp_product_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS shopapp_product_fts_au AFTER UPDATE OF name, description ON shopapp_product BEGIN
+            INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO shopapp_product_fts(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+def _fts_table_exists(cursor) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [PRODUCT_FTS_TABLE],
+    )
+    return cursor.fetchone() is not None
+
+
+def install_product_fts(connection: BaseDatabaseWrapper, create: bool = True) -> None:
+    """
+    Создает FTS-таблицу и триггеры, если их нет.
+
+    Миграции SQLite пересоздают ``shopapp_product`` при изменении полей,
+    и триггеры при этом пропадают. Поэтому функция вызывается и после
+    каждого ``migrate``: недостающие триггеры создаются заново, а индекс
+    перестраивается. С ``create=False`` таблица не создается, если
+    миграция с ней еще не применена.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if not _fts_table_exists(cursor):
+            if not create:
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {PRODUCT_FTS_TABLE} USING fts5("
+                "name, description, "
+                "content='shopapp_product', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'shopapp_product'"
+        )
+        existing = {name for (name,) in cursor.fetchall()}
+        if existing >= _PRODUCT_FTS_TRIGGERS.keys():
+            return
+        for sql in _PRODUCT_FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {PRODUCT_FTS_TABLE}({PRODUCT_FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_product_fts_triggers(connection: BaseDatabaseWrapper) -> None:
+    """
+    Убирает триггеры, чтобы массовая загрузка не обновляла индекс
+    построчно. После загрузки ``install_product_fts`` вернет триггеры
+    и перестроит индекс целиком.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in _PRODUCT_FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def uninstall_product_fts(connection: BaseDatabaseWrapper) -> None:
+    if connection.vendor != 'sqlite':
+        return
+    drop_product_fts_triggers(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {PRODUCT_FTS_TABLE}')
+
+
+def build_fts_query(terms: Iterable[str]) -> str:
+    """
+    Превращает поисковые слова в запрос FTS5: каждое слово в кавычках
+    как префикс, все слова должны встретиться (неявный AND).
+    """
+    return ' '.join(
+        '"{}"*'.format(term.replace('"', '""'))
+        for term in terms
+        if term
+    )
+
+
+def search_products(queryset: QuerySet, terms: Iterable[str], rank: bool = True) -> QuerySet | None:
+    """
+    Фильтрует товары по полнотекстовому индексу.
+
+    При ``rank=True`` добавляет аннотацию ``search_rank`` (bm25, меньше -
+    лучше) и сортирует по ней. Возвращает ``None``, если FTS недоступен.
+    """
+    if connections[queryset.db].vendor != 'sqlite':
+        return None
+    query = build_fts_query(terms)
+    if not query:
+        return queryset
+    table = queryset.model._meta.db_table
+    queryset = queryset.filter(
+        pk__in=RawSQL(
+            f'SELECT rowid FROM {PRODUCT_FTS_TABLE} WHERE {PRODUCT_FTS_TABLE} MATCH %s',
+            [query],
+        )
+    )
+    if not rank:
+        return queryset
+    weights = ', '.join(str(weight) for weight in PRODUCT_FTS_WEIGHTS)
+    return queryset.annotate(
+        search_rank=RawSQL(
+            f'SELECT bm25({PRODUCT_FTS_TABLE}, {weights}) FROM {PRODUCT_FTS_TABLE} '
+            f'WHERE {PRODUCT_FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [query],
+            output_field=FloatField(),
+        )
+    ).order_by('search_rank', 'pk')
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    ``SearchFilter`` для товаров через FTS5 вместо ``LIKE '%term%'``.
+
+    Если клиент не передал ``ordering``, результаты идут по релевантности.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        result = search_products(queryset, terms)
+        if result is None:
+            return super().filter_queryset(request, queryset, view)
+        return result
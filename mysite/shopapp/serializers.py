@@ -1,9 +1,246 @@
-from rest_framework import serializers
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import ISO_8601, serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
 
-from .models import Product
+from .models import Order, Product
+from .renditions import build_srcset, get_renditions
 
 
-class ProductSerializer(serializers.ModelSerializer):
+@extend_schema_field(OpenApiTypes.STR)
+class SrcsetField(serializers.Field):
+    """
+    ``srcset`` уменьшенных копий изображения; ``null``, пока их нет.
+    """
+
+    def __init__(self, key: str = 'fallback', **kwargs):
+        self.key = key
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        # value - FieldFile или, в ValuesSerializer, имя файла.
+        manifest = get_renditions(getattr(value, 'name', value)) if value else None
+        if not manifest:
+            return None
+        request = self.context.get('request')
+        return build_srcset(manifest, self.key, request.build_absolute_uri if request else None)
+
+
+class SparseFieldsetsMixin:
+    """
+    ``?fields=pk,total`` оставляет в ответе только перечисленные поля
+    (из ``Meta.fields``), ``?exclude=description`` - все, кроме
+    перечисленных. Ненужные поля даже не создаются, а view по ним
+    выбирает из базы только нужные столбцы. Изменяющие запросы
+    параметры не учитывают и работают со всеми полями.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    @classmethod
+    def _parse_param(cls, request, param: str) -> set[str] | None:
+        value = request.query_params.get(param)
+        if not value:
+            return None
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names.difference(cls.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                param: f'Unknown fields: {", ".join(sorted(unknown))}',
+            })
+        return names
+
+    @classmethod
+    def requested_fields(cls, request) -> list[str]:
+        available = list(cls.Meta.fields)
+        if request is None or request.method not in SAFE_METHODS:
+            return available
+        only = cls._parse_param(request, cls.fields_query_param)
+        exclude = cls._parse_param(request, cls.exclude_query_param) or set()
+        return [
+            name for name in available
+            if (only is None or name in only) and name not in exclude
+        ]
+
+    @classmethod
+    def narrow_queryset(cls, queryset, request, keep=()):
+        """
+        ``.only()`` по ``?fields=`` или ``.defer()`` по ``?exclude=``.
+        Столбцы ``keep`` (например, порядка для курсора) читаются всегда.
+        """
+        if request.method not in SAFE_METHODS:
+            return queryset
+        needed = model_columns(cls, cls.requested_fields(request))
+        if request.query_params.get(cls.fields_query_param):
+            return queryset.only(*needed, *keep)
+        if request.query_params.get(cls.exclude_query_param):
+            deferred = [
+                column for column in model_columns(cls, cls.Meta.fields)
+                if column not in needed and column not in keep
+            ]
+            return queryset.defer(*deferred)
+        return queryset
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        requested = self.requested_fields(self.context.get('request'))
+        return [name for name in names if name in requested]
+
+
+def model_columns(serializer_class, names: list[str]) -> list[str]:
+    """
+    Столбцы модели, которые читают поля ``names`` сериализатора:
+    для вложенных сериализаторов и вычисляемых полей - ничего.
+    """
+    meta = serializer_class.Meta.model._meta
+    concrete = {field.name for field in meta.concrete_fields if not field.is_relation}
+    declared = serializer_class._declared_fields
+    columns = []
+    for name in names:
+        source = declared[name].source if name in declared and declared[name].source else name
+        if source == 'pk':
+            source = meta.pk.name
+        if source in concrete and source not in columns:
+            columns.append(source)
+    return columns
+
+
+def _decimal_converter(field: serializers.DecimalField):
+    if (
+        field.decimal_places is None
+        or field.normalize_output
+        or field.localize
+        or not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    ):
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def convert(value):
+        # Значения из базы уже с нужным числом знаков: quantize не нужен.
+        if value.as_tuple().exponent == exponent:
+            return f'{value:f}'
+        return field.to_representation(value)
+
+    return convert
+
+
+def _datetime_converter(field: serializers.DateTimeField):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return convert
+
+
+def _file_converter(field: serializers.FileField, model_field, request):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    storage = model_field.storage
+    if request is None:
+        return lambda name: storage.url(name) if name else None
+    absolute_uri = request.build_absolute_uri
+    return lambda name: absolute_uri(storage.url(name)) if name else None
+
+
+class ValuesSerializer:
+    """
+    Быстрый путь сериализации списков только для чтения.
+
+    Строки берутся из ``values_list()``, а не из экземпляров модели, и
+    для каждого поля один раз выбирается функция-конвертер; поля DRF
+    не привязываются к каждой строке. Результат совпадает с
+    ``serializer_class(rows, many=True).data`` байт в байт после
+    рендеринга в JSON. Подходят сериализаторы, все поля которых читают
+    обычные столбцы модели (в том числе ``SrcsetField``).
+    """
+    # Поля, у которых значение из базы уже готово для ответа.
+    IDENTITY_FIELDS = (
+        serializers.ReadOnlyField,
+        serializers.CharField,
+        serializers.IntegerField,
+        serializers.BooleanField,
+    )
+
+    def __init__(self, serializer_class, context: dict | None = None):
+        serializer = serializer_class(context=context or {})
+        request = serializer.context.get('request')
+        meta = serializer_class.Meta.model._meta
+        self.names = []
+        self.columns = []
+        self.converters = []
+        for field in serializer._readable_fields:
+            source = field.source
+            try:
+                model_field = meta.pk if source == 'pk' else meta.get_field(source)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is None or not model_field.concrete or model_field.is_relation:
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{field.field_name} does not read a plain model column',
+                )
+            if source not in self.columns:
+                self.columns.append(source)
+            self.names.append(field.field_name)
+            self.converters.append((self.columns.index(source), self._converter(field, model_field, request)))
+
+    @classmethod
+    def _converter(cls, field, model_field, request):
+        if isinstance(field, serializers.FileField):
+            return _file_converter(field, model_field, request)
+        if isinstance(field, serializers.DecimalField):
+            return _decimal_converter(field)
+        if isinstance(field, serializers.DateTimeField):
+            return _datetime_converter(field)
+        if type(field) in cls.IDENTITY_FIELDS:
+            return None
+        return field.to_representation
+
+    def values_list(self, queryset, extra=()):
+        """
+        Выборка для ``serialize``. Столбцы ``extra`` (например, для
+        курсора пагинации) добавляются в конец строки, а строки тогда
+        именованные: курсор читает значения как атрибуты. ``pk`` в
+        именованных строках есть всегда - курсор добавляет его к порядку,
+        даже если ``?fields=`` его не запросил.
+        """
+        named = bool(extra)
+        if named:
+            extra = [*extra, 'pk']
+        extra = list(dict.fromkeys(name for name in extra if name not in self.columns))
+        return queryset.values_list(*self.columns, *extra, named=named)
+
+    def serialize(self, rows) -> list[dict]:
+        names = self.names
+        converters = self.converters
+        data = []
+        for row in rows:
+            values = []
+            for index, convert in converters:
+                value = row[index]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                values.append(value)
+            data.append(dict(zip(names, values)))
+        return data
+
+
+class ProductSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    preview_srcset = SrcsetField(source='preview')
+    preview_webp_srcset = SrcsetField(key='webp', source='preview')
+
     class Meta:
         model = Product
         fields = (
@@ -14,5 +251,41 @@ class ProductSerializer(serializers.ModelSerializer):
             'discount',
             'created_at',
             'archived',
-            'preview'
-        )
\ No newline at end of file
+            'preview',
+            'preview_srcset',
+            'preview_webp_srcset',
+        )
+
+
+class OrderUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('pk', 'username')
+
+
+class OrderProductSerializer(serializers.ModelSerializer):
+    """
+    Товар в составе заказа: без описания и картинок.
+    """
+
+    class Meta:
+        model = Product
+        fields = ('pk', 'name', 'price', 'discount')
+
+
+class OrderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    user = OrderUserSerializer(read_only=True)
+    products = OrderProductSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = (
+            'pk',
+            'created_at',
+            'delivery_address',
+            'promocode',
+            'total',
+            'products_count',
+            'user',
+            'products',
+        )
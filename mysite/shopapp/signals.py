@@ -0,0 +1,112 @@
+from django.db import connections
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_products_version, invalidate_product_details
+from .models import Order, Product, ProductImage
+from .renditions import schedule_renditions
+from .search import install_product_fts
+
+# Поля с изображениями, для которых делаются копии под srcset.
+RENDITION_FIELDS = {
+    Product: 'preview',
+    ProductImage: 'image',
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance: Product, **kwargs):
+    bump_products_version()
+    invalidate_product_details([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance: ProductImage, **kwargs):
+    # Картинки входят в страницу товара: обновляем его updated_at.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance: Product, created: bool, update_fields=None, **kwargs):
+    if update_fields is not None and 'price' not in update_fields:
+        return
+    if 'price' not in instance.__dict__:
+        # Отложенное поле save() не пишет - цена не менялась.
+        return
+    # Цену могли присвоить строкой: сравниваем уже как Decimal.
+    to_python = Product._meta.get_field('price').to_python
+    price = to_python(instance.price)
+    old_price = to_python(getattr(instance, '_loaded_price', None))
+    instance._loaded_price = price
+    if created or old_price == price:
+        return
+    orders = Order.objects.filter(products=instance)
+    if old_price is None:
+        # Прежняя цена неизвестна (поле было отложено) - считаем заново.
+        orders.refresh_totals()
+    else:
+        # Товар входит в заказ не больше одного раза, поэтому сумма
+        # каждого такого заказа меняется ровно на разницу в цене.
+        orders.add_to_totals(price - old_price, 0)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_orders(sender, instance: Product, **kwargs):
+    # Строки связи удаляются каскадом без m2m_changed.
+    instance._order_ids = list(instance.orders.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance: Product, **kwargs):
+    order_ids = getattr(instance, '_order_ids', None)
+    if order_ids:
+        Order.objects.filter(pk__in=order_ids).refresh_totals()
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_order_ids = list(instance.orders.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_add' and not reverse:
+        # Django передает в pk_set только реально добавленные товары.
+        if pk_set:
+            added_total = Product.objects.filter(pk__in=pk_set).aggregate(total=Sum('price'))['total']
+            Order.objects.filter(pk=instance.pk).add_to_totals(added_total or 0, len(pk_set))
+        return
+
+    if not reverse:
+        orders = Order.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        orders = Order.objects.filter(pk__in=getattr(instance, '_cleared_order_ids', []))
+    else:
+        orders = Order.objects.filter(pk__in=pk_set or [])
+    orders.refresh_totals()
+
+
+def ensure_product_fts(sender, using, **kwargs):
+    # Пересоздание таблицы в миграциях SQLite удаляет триггеры FTS.
+    install_product_fts(connections[using], create=False)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def remember_image_upload(sender, instance, **kwargs):
+    # Новый файл еще не сохранен в хранилище: это сделает pre_save поля.
+    image = getattr(instance, RENDITION_FIELDS[sender])
+    instance._image_uploaded = bool(image) and not image._committed
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_uploaded(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        schedule_renditions(getattr(instance, RENDITION_FIELDS[sender]).name)
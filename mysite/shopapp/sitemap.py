@@ -0,0 +1,16 @@
+from django.urls import reverse
+
+from mysite.sitemap_cache import CachedSitemap
+
+from .models import Product
+
+
+class ProductSitemap(CachedSitemap):
+    changefreq = 'weekly'
+    priority = 0.8
+
+    def get_queryset(self):
+        return Product.objects.filter(archived=False)
+
+    def location(self, obj):
+        return reverse('shopapp:product_detail', kwargs={'pk': obj.pk})
@@ -0,0 +1,45 @@
+from django import template
+from django.db.models.fields.files import FieldFile
+from django.utils.html import format_html
+
+from shopapp.renditions import build_srcset, get_renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(image: FieldFile, key: str = 'fallback') -> str:
+    """
+    ``srcset`` уменьшенных копий: ``{% srcset product.preview 'webp' %}``.
+    """
+    manifest = get_renditions(image.name) if image else None
+    return build_srcset(manifest, key) if manifest else ''
+
+
+@register.simple_tag
+def responsive_image(image: FieldFile, alt: str = '', sizes: str = '100vw', loading: str = 'lazy') -> str:
+    """
+    ``<picture>`` с WebP и запасным форматом. Пока копий нет,
+    выводится обычный ``<img>`` с оригиналом.
+    """
+    if not image:
+        return ''
+    manifest = get_renditions(image.name)
+    if not manifest:
+        return format_html('<img src="{}" alt="{}" loading="{}">', image.url, alt, loading)
+    largest = manifest['renditions'][-1]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        build_srcset(manifest, 'webp'),
+        sizes,
+        image.storage.url(largest['fallback']),
+        build_srcset(manifest, 'fallback'),
+        sizes,
+        largest['width'],
+        largest['height'],
+        alt,
+        loading,
+    )
@@ -1,14 +1,59 @@
+from csv import DictReader
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+import json
+import sqlite3
 from itertools import product
 from random import choice
 from string import ascii_letters
+from tempfile import TemporaryDirectory
+import threading
+from unittest.mock import patch
 
 from django.conf import settings
-from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.shortcuts import render
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import translation
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 
-from shopapp.models import Product
+from blogapp.models import Article
+from shopapp.benchmarks import (
+    SCENARIOS,
+    benchmark_serializers,
+    benchmark_templates,
+    compare_results,
+    run_benchmarks,
+    seed_dataset,
+)
+from shopapp.caching import PRODUCT_DETAILS_BUMP_LIMIT, bump_products_version, get_product_detail, get_products_version
+from shopapp.common import add_products_to_order, import_orders, save_csv_products
+from shopapp.models import Order, Product, ProductImage, ProductQuerySet
+from shopapp.renditions import get_renditions
+from shopapp.search import search_products
+from shopapp.serializers import ProductSerializer, ValuesSerializer
 from shopapp.utils import add_two_numbers
+from shopapp.views import ProductViewSet
+from requestdataapp.querycheck import QueryBudgetExceeded, install_query_inspector, query_budget
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 
 # Create your tests here.
@@ -138,4 +183,904 @@ class ProductsExportViewTestCase(TestCase):
         self.assertEqual(
             products_data['products'],
             expected_data,
-        )
\ No newline at end of file
+        )
+
+class ProductsCSVDownloadTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def test_download_csv_streams_all_products(self):
+        response = self.client.get(
+            reverse('shopapp:products-download-csv'),
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        rows = list(DictReader(StringIO(content)))
+        self.assertEqual(len(rows), Product.objects.count())
+        self.assertEqual(
+            list(rows[0].keys()),
+            ['name', 'description', 'price', 'discount'],
+        )
+
+
+class SaveCSVProductsTestCase(TestCase):
+    def test_import_in_batches_skips_invalid_rows(self):
+        csv_file = BytesIO(
+            b'name,description,price,discount\n'
+            b'Laptop 17,A new one,2299.00,5\n'
+            b'Broken,Bad price,abc,1\n'
+            b'Laptop 18,A bigger one,2699.00,7\n'
+            b'Laptop 19,The biggest one,2999.00,9\n'
+        )
+        result = save_csv_products(csv_file, encoding='utf-8', batch_size=2)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(result.errors[0][0], 3)
+        self.assertIn('price', result.errors[0][1])
+        self.assertFalse(Product.objects.filter(name='Broken').exists())
+
+    def test_upsert_updates_existing_products_by_name(self):
+        Product.objects.create(name='Laptop 17', price='1000.00')
+        csv_file = BytesIO(
+            b'name,price\n'
+            b'Laptop 17,2299.00\n'
+            b'Laptop 18,2699.00\n'
+        )
+        result = save_csv_products(csv_file, encoding='utf-8', upsert=True)
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(Product.objects.get(name='Laptop 17').price, Decimal('2299.00'))
+        self.assertEqual(Product.objects.filter(name='Laptop 17').count(), 1)
+
+
+class AdminExportActionsTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_superuser(username='admin_test', password='qwerty')
+        self.client.force_login(self.user)
+
+    def test_export_products_as_jsonl(self):
+        pks = list(Product.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            reverse('admin:shopapp_product_changelist'),
+            {'action': 'export_jsonl', '_selected_action': pks},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), len(pks))
+        self.assertEqual(
+            set(json.loads(lines[0])),
+            {'id', 'name', 'description', 'price', 'discount', 'created_at', 'updated_at', 'archived', 'preview'},
+        )
+
+    def test_export_orders_as_csv(self):
+        order = Order.objects.create(user=self.user, delivery_address='ul Ivanova, d 8')
+        response = self.client.post(
+            reverse('admin:shopapp_order_changelist'),
+            {'action': 'export_csv', '_selected_action': [order.pk]},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        rows = list(DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['delivery_address'], 'ul Ivanova, d 8')
+        self.assertEqual(rows[0]['user'], str(self.user.pk))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductsExportCacheTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def tearDown(self) -> None:
+        cache.clear()
+
+    def test_if_none_match_returns_not_modified(self):
+        url = reverse('shopapp:products_export')
+        response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_queryset_update_invalidates_export(self):
+        url = reverse('shopapp:products_export')
+        etag = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=1).update(archived=True)
+        response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(response.json()['products'][0]['archived'])
+
+
+class ProductsKeysetPaginationTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def fetch_all(self, **params):
+        pks = []
+        with translation.override('en'):
+            url = reverse('shopapp:products-list')
+        data = {'cursor': '', 'page_size': 4, **params}
+        while url:
+            response = self.client.get(url, data, HTTP_USER_AGENT='Mozilla/5.0')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.json())
+            pks.extend(product['pk'] for product in response.json()['results'])
+            url = response.json()['next']
+            data = None
+        return pks
+
+    def test_default_ordering_pages_through_whole_catalog(self):
+        expected = list(Product.objects.order_by('-name', 'price', 'pk').values_list('pk', flat=True))
+        self.assertEqual(self.fetch_all(), expected)
+
+    def test_ordering_filter_with_pk_tiebreaker(self):
+        expected = list(Product.objects.order_by('-price', 'pk').values_list('pk', flat=True))
+        self.assertEqual(self.fetch_all(ordering='-price'), expected)
+
+    def test_sparse_fields_without_pk(self):
+        with translation.override('en'):
+            url = reverse('shopapp:products-list')
+        data = {'cursor': '', 'page_size': 2, 'fields': 'price,discount'}
+        results = []
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            results.extend(response.json()['results'])
+            url = response.json()['next']
+            data = None
+        self.assertEqual(len(results), Product.objects.count())
+        self.assertEqual(set(results[0]), {'price', 'discount'})
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse('shopapp:products-list'),
+            {'cursor': 'garbage'},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        self.laptop = Product.objects.create(name='Laptop 17', description='A new one')
+        self.phone = Product.objects.create(name='Phone', description='Works with any laptop')
+        Product.objects.create(name='Desktop', description='A bigger one')
+
+    def search(self, term):
+        response = self.client.get(
+            reverse('shopapp:products-list'),
+            {'search': term},
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        return [product['pk'] for product in response.json()['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search('lapt'), [self.laptop.pk, self.phone.pk])
+
+    def test_index_follows_queryset_update(self):
+        Product.objects.filter(pk=self.phone.pk).update(description='Works alone')
+        self.assertEqual(self.search('laptop'), [self.laptop.pk])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('laptop new'), [self.laptop.pk])
+
+
+class ExplainQueriesCommandTestCase(TestCase):
+    def test_main_querysets_have_no_unexpected_scans(self):
+        out = StringIO()
+        call_command('explain_queries', '--fail-on-warning', stdout=out)
+        self.assertIn('shopapp_product_active_idx', out.getvalue())
+        self.assertIn('blogapp_article_published_idx', out.getvalue())
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='totals_test', password='qwerty')
+        self.laptop = Product.objects.create(name='Laptop', price='1999.00')
+        self.phone = Product.objects.create(name='Phone', price='999.00')
+        self.order = Order.objects.create(user=self.user)
+
+    def assertTotals(self, total, products_count):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal(total))
+        self.assertEqual(self.order.products_count, products_count)
+
+    def test_totals_follow_products_changes(self):
+        self.order.products.add(self.laptop, self.phone)
+        self.assertTotals('2998.00', 2)
+        self.order.products.remove(self.phone)
+        self.assertTotals('1999.00', 1)
+        self.laptop.orders.clear()
+        self.assertTotals('0', 0)
+
+    def test_totals_follow_price_changes(self):
+        self.order.products.add(self.laptop, self.phone)
+        self.laptop.price = '1500.00'
+        self.laptop.save()
+        self.assertTotals('2499.00', 2)
+        phone = Product.objects.defer('price').get(pk=self.phone.pk)
+        phone.price = Decimal('899.00')
+        phone.save()
+        self.assertTotals('2399.00', 2)
+        Product.objects.filter(pk=self.phone.pk).update(price='500.00')
+        self.assertTotals('2000.00', 2)
+        self.phone.delete()
+        self.assertTotals('1500.00', 1)
+
+    def test_verify_command_detects_stale_totals(self):
+        self.order.products.add(self.laptop)
+        call_command('order_totals', stdout=StringIO())
+        Order.objects.update(total=0)
+        with self.assertRaises(CommandError):
+            call_command('order_totals', stdout=StringIO())
+        call_command('order_totals', '--backfill', stdout=StringIO())
+        self.assertTotals('1999.00', 1)
+
+
+class ImportOrdersTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='import_test', password='qwerty')
+        self.laptop = Product.objects.create(name='Laptop', price='1999.00')
+        self.phone = Product.objects.create(name='Phone', price='999.00')
+
+    def test_orders_are_written_with_totals(self):
+        lines = [
+            json.dumps({'username': 'import_test', 'products': [self.laptop.pk, self.phone.pk]}),
+            json.dumps({'username': 'nobody', 'products': [self.laptop.pk]}),
+            json.dumps({'username': 'import_test', 'products': [self.phone.pk], 'promocode': 'promo5'}),
+            'not json',
+        ]
+        result = import_orders(lines, batch_size=2)
+        self.assertEqual((result.created, result.skipped), (2, 2))
+        self.assertEqual([line for line, errors in result.errors], [2, 4])
+        orders = Order.objects.order_by('pk')
+        self.assertEqual(
+            [(order.total, order.products_count) for order in orders],
+            [(Decimal('2998.00'), 2), (Decimal('999.00'), 1)],
+        )
+        self.assertEqual(list(orders[1].products.all()), [self.phone])
+
+    def test_add_products_to_order_skips_duplicates(self):
+        order = Order.objects.create(user=self.user)
+        order.products.add(self.laptop)
+        with self.assertNumQueries(6):
+            products_count = add_products_to_order(order, [self.laptop.pk, self.phone.pk, 0])
+        self.assertEqual(products_count, 2)
+        self.assertEqual(order.total, Decimal('2998.00'))
+
+    def limit_sqlite_variables(self):
+        # Лимит параметров как в сборках SQLite со значением по умолчанию.
+        connection.ensure_connection()
+        limit = connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        self.addCleanup(connection.connection.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+
+    def test_orders_with_many_products(self):
+        self.limit_sqlite_variables()
+        products = Product.objects.bulk_create(Product(name=f'Cable {i}', price='1.00') for i in range(1200))
+        lines = [
+            json.dumps({'username': 'import_test', 'products': [product.pk for product in products[:600]]}),
+            json.dumps({'username': 'import_test', 'products': [product.pk for product in products[600:]]}),
+        ]
+        result = import_orders(lines)
+        self.assertEqual((result.created, result.skipped), (2, 0))
+        self.assertEqual(Order.products.through.objects.count(), 1200)
+
+    def test_add_products_to_order_with_many_ids(self):
+        order = Order.objects.create(user=self.user)
+        self.limit_sqlite_variables()
+        missing = range(10 ** 6, 10 ** 6 + 5000)
+        self.assertEqual(add_products_to_order(order, [*missing, self.laptop.pk]), 1)
+        self.assertEqual(add_products_to_order(order, Product.objects.values_list('pk', flat=True)), 2)
+        self.assertEqual(order.total, Decimal('2998.00'))
+
+
+class AsyncProductViewsTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    async def test_product_detail(self):
+        product = await Product.objects.aget(pk=3)
+        response = await self.async_client.get(
+            reverse('shopapp:product_detail', kwargs={'pk': product.pk}),
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertContains(response, product.name)
+
+    async def test_pages_render_outside_event_loop(self):
+        threads = []
+
+        def render_page(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return render(*args, **kwargs)
+
+        with translation.override('en'):
+            urls = [reverse('shopapp:products_list'), reverse('shopapp:product_detail', kwargs={'pk': 3})]
+        with patch('shopapp.views.render', render_page):
+            for url in urls:
+                response = await self.async_client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_product_detail_not_found(self):
+        response = await self.async_client.get(
+            reverse('shopapp:product_detail', kwargs={'pk': 100500}),
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_products_export(self):
+        response = await self.async_client.get(
+            reverse('shopapp:products_export'),
+            HTTP_USER_AGENT='Mozilla/5.0',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['products']), await Product.objects.acount())
+
+
+class QueryInspectionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='admin_n1', password='qwerty')
+        for i in range(6):
+            group = Group.objects.create(name=f'Group {i}')
+            group.permissions.set(Permission.objects.filter(codename__endswith='_order'))
+        cls.products = Product.objects.bulk_create(
+            Product(name=f'Product {i}', price=Decimal(10 + i)) for i in range(6)
+        )
+        for i in range(6):
+            order = Order.objects.create(user=cls.user, delivery_address=f'ul Lenina, d {i}')
+            add_products_to_order(order, [product.pk for product in cls.products])
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def test_pages_stay_within_query_budgets(self):
+        # В тестах N+1 и превышение бюджета view - исключение QueryBudgetExceeded.
+        with translation.override('en'):
+            urls = self.page_urls()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_USER_AGENT='Mozilla/5.0')
+                self.assertEqual(response.status_code, 200)
+
+    def test_repeated_queries_are_reported_with_call_site(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'shopapp/tests.py:'):
+            with query_budget(3):
+                for order in Order.objects.all():
+                    order.user.username
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_exceeded_budget_is_logged_outside_tests(self):
+        with self.assertLogs('requestdataapp.querycheck', 'WARNING') as logs:
+            with query_budget(1):
+                list(Order.objects.all())
+                list(Product.objects.all())
+        self.assertIn('made 2 queries, budget is 1', logs.output[0])
+
+    @override_settings(QUERY_INSPECTION=False)
+    def test_nothing_is_inspected_when_disabled(self):
+        with patch('requestdataapp.querycheck.find_call_site') as find_call_site:
+            with query_budget(0) as query_log:
+                for order in Order.objects.all():
+                    order.user.username
+        self.assertIsNone(query_log)
+        find_call_site.assert_not_called()
+
+        class Connection:
+            execute_wrappers = []
+
+        install_query_inspector(None, Connection())
+        self.assertEqual(Connection.execute_wrappers, [])
+
+    def page_urls(self):
+        return [
+            reverse('shopapp:orders_list'),
+            reverse('shopapp:order_details', kwargs={'pk': Order.objects.first().pk}),
+            reverse('shopapp:groups_list'),
+            reverse('admin:shopapp_order_changelist'),
+            reverse('admin:shopapp_order_change', args=[Order.objects.first().pk]),
+            reverse('admin:shopapp_product_changelist'),
+            reverse('admin:shopapp_product_change', args=[self.products[0].pk]),
+        ]
+
+
+class BenchmarksTestCase(TestCase):
+    def test_all_scenarios_are_measured_and_compared(self):
+        data = seed_dataset(products=30, orders=5, articles=5, seed=1)
+        results = run_benchmarks(data, iterations=2, warmup=0)
+
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        for result in results['scenarios'].values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries'], 0)
+        self.assertEqual(compare_results(results, results, tolerance=0.25), [])
+
+        baseline = json.loads(json.dumps(results))
+        baseline['scenarios']['order_list']['queries'] -= 1
+        regressions = compare_results(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('order_list: queries', regressions[0])
+
+
+class GenerateDataTestCase(TestCase):
+    def test_generated_data_is_consistent(self):
+        out = StringIO()
+        call_command(
+            'generate_data', users=5, products=40, orders=30, articles=10,
+            seed=7, batch_size=16, stdout=out,
+        )
+        self.assertIn('Generated 5 users, 40 products, 10 articles, 30 orders', out.getvalue())
+
+        self.assertEqual(User.objects.filter(profile__isnull=False).count(), 5)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertGreater(Product.objects.values('created_at').distinct().count(), 1)
+        self.assertEqual(
+            Order.objects.aggregate(count=Sum('products_count'))['count'],
+            Order.products.through.objects.count(),
+        )
+        word = Product.objects.first().name.split()[1]
+        self.assertTrue(search_products(Product.objects.all(), [word]).exists())
+
+    def generated_snapshot(self, **options) -> list:
+        call_command(
+            'generate_data', users=5, products=40, orders=30, articles=10,
+            batch_size=16, stdout=StringIO(), **options,
+        )
+        snapshot = [
+            list(User.objects.order_by('pk').values_list('pk', 'username', 'first_name', 'date_joined')),
+            list(Product.objects.order_by('pk').values_list(
+                'pk', 'name', 'description', 'price', 'discount', 'created_at', 'archived', 'updated_at',
+            )),
+            list(Order.objects.order_by('pk').values_list(
+                'pk', 'user_id', 'delivery_address', 'promocode', 'created_at', 'total', 'updated_at',
+            )),
+            list(Order.products.through.objects.order_by('order_id', 'product_id').values_list('order_id', 'product_id')),
+            list(Article.objects.order_by('pk').values_list('pk', 'title', 'body', 'published_at', 'updated_at')),
+        ]
+        for model in (Order, Article, Product, User):
+            model.objects.all().delete()
+        return snapshot
+
+    def test_same_seed_gives_same_data(self):
+        first = self.generated_snapshot(seed=7)
+        self.assertEqual(self.generated_snapshot(seed=7), first)
+        self.assertNotEqual(self.generated_snapshot(seed=8), first)
+
+        end = datetime(2020, 6, 1, tzinfo=timezone.utc)
+        shifted = self.generated_snapshot(seed=7, end=end)
+        # Меняются только даты.
+        self.assertEqual([row[:5] for row in shifted[1]], [row[:5] for row in first[1]])
+        self.assertLessEqual(max(row[4] for row in shifted[2]), end)
+        for rows in shifted[1:3]:
+            self.assertLessEqual(max(row[-1] for row in rows), end)
+        self.assertLessEqual(max(row[-1] for row in shifted[4]), end)
+        self.assertGreater(min(row[4] for row in first[2]), end)
+
+    def test_orders_need_users_and_products(self):
+        with self.assertRaisesMessage(CommandError, 'Orders need users and products'):
+            call_command('generate_data', users=0, products=0, orders=10, articles=0, stdout=StringIO())
+
+
+def make_image(size: tuple[int, int], mode: str = 'RGB', image_format: str = 'JPEG') -> bytes:
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IMAGE_RENDITIONS_SYNC=True)
+class ImageRenditionsTestCase(TestCase):
+    def setUp(self) -> None:
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+
+    def create_product(self, content: bytes, filename: str) -> Product:
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Camera',
+                preview=SimpleUploadedFile(filename, content),
+            )
+
+    def test_renditions_are_generated_on_upload(self):
+        product = self.create_product(make_image((800, 400)), 'camera.jpg')
+
+        manifest = get_renditions(product.preview.name)
+        self.assertEqual(
+            [(rendition['width'], rendition['height']) for rendition in manifest['renditions']],
+            [(160, 80), (320, 160), (640, 320)],
+        )
+        with default_storage.open(manifest['renditions'][0]['webp']) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 80)))
+
+        html = Template('{% load renditions %}{% responsive_image product.preview alt="Camera" %}').render(
+            Context({'product': product}),
+        )
+        self.assertIn('<source type="image/webp" srcset="/media/', html)
+        self.assertIn('.640w.jpg 640w"', html)
+
+    def test_small_transparent_image_is_not_upscaled(self):
+        product = self.create_product(make_image((100, 50), 'RGBA', 'PNG'), 'icon.png')
+
+        renditions = get_renditions(product.preview.name)['renditions']
+        self.assertEqual(len(renditions), 1)
+        self.assertEqual(renditions[0]['width'], 100)
+        self.assertTrue(renditions[0]['fallback'].endswith('.100w.png'))
+
+    def test_api_returns_srcset(self):
+        product = self.create_product(make_image((400, 400)), 'phone.jpg')
+        Product.objects.create(name='No preview')
+
+        response = self.client.get(reverse('shopapp:products-list'), {'ordering': 'name'})
+        results = response.json()['results']
+        self.assertIsNone(results[1]['preview_srcset'])
+        self.assertRegex(
+            results[0]['preview_webp_srcset'],
+            r'^http://testserver/media/product/product_None/preview/phone\S*\.160w\.webp 160w, .+ 400w$',
+        )
+        self.assertEqual(results[0]['pk'], product.pk)
+
+
+class OrderViewSetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='qwerty')
+        cls.bob = User.objects.create_user(username='bob', password='qwerty')
+        cls.manager = User.objects.create_user(username='manager', password='qwerty')
+        cls.manager.user_permissions.add(Permission.objects.get(codename='view_order'))
+        products = [Product.objects.create(name=f'Product {i}', price=10 + i, description='x' * 500) for i in range(3)]
+        for i in range(6):
+            order = Order.objects.create(user=cls.alice if i % 2 else cls.bob, delivery_address=f'street {i}')
+            add_products_to_order(order, [product.pk for product in products[:1 + i % 3]])
+
+    def fetch_all(self, **params) -> list[dict]:
+        orders = []
+        with translation.override('en'):
+            url = reverse('shopapp:orders-list')
+        data = {'page_size': 4, **params}
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200, response.content)
+            orders.extend(response.json()['results'])
+            url = response.json()['next']
+            data = None
+        return orders
+
+    def test_pages_through_visible_orders(self):
+        self.client.force_login(self.manager)
+        expected = list(Order.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        orders = self.fetch_all()
+        self.assertEqual([order['pk'] for order in orders], expected)
+        self.assertEqual(set(orders[0]['products'][0]), {'pk', 'name', 'price', 'discount'})
+        self.assertEqual(orders[0]['user']['username'], 'alice')
+
+        self.client.force_login(self.alice)
+        self.assertEqual({order['user']['pk'] for order in self.fetch_all()}, {self.alice.pk})
+
+    def test_filter_by_user(self):
+        self.client.force_login(self.manager)
+        orders = self.fetch_all(user=self.alice.pk, created_at__gte='2000-01-01T00:00:00Z')
+        self.assertEqual(len(orders), 3)
+
+    def test_sparse_fieldset_selects_only_requested_columns(self):
+        self.client.force_login(self.manager)
+        with translation.override('en'):
+            url = reverse('shopapp:orders-list')
+        with query_budget(10) as query_log:
+            response = self.client.get(url, {'fields': 'pk,total'})
+        self.assertEqual(set(response.json()['results'][0]), {'pk', 'total'})
+        orders_sql = [shape for shape in query_log.shapes if 'shopapp_order' in shape]
+        self.assertEqual(len(orders_sql), 1)
+        self.assertNotIn('delivery_address', orders_sql[0])
+        self.assertNotIn('shopapp_product', ''.join(query_log.shapes))
+
+    def test_retrieve(self):
+        self.client.force_login(self.alice)
+        order = Order.objects.filter(user=self.alice).first()
+        with translation.override('en'):
+            url = reverse('shopapp:orders-detail', kwargs={'pk': order.pk})
+        response = self.client.get(url, {'fields': 'pk,products_count'})
+        self.assertEqual(response.json(), {'pk': order.pk, 'products_count': order.products_count})
+
+    def test_unknown_field(self):
+        self.client.force_login(self.manager)
+        with translation.override('en'):
+            url = reverse('shopapp:orders-list')
+        response = self.client.get(url, {'fields': 'pk,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductSparseFieldsetsTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def get(self, **params):
+        cache.clear()
+        with translation.override('en'):
+            url = reverse('shopapp:products-list')
+        with query_budget(10) as query_log:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        # Кроме запроса валидаторов условного GET (MAX(updated_at)).
+        product_queries = [
+            shape for shape in query_log.shapes
+            if 'FROM "shopapp_product"' in shape and 'MAX(' not in shape
+        ]
+        return response.json()['results'], product_queries
+
+    def test_fields_selects_only_requested_columns(self):
+        results, queries = self.get(fields='pk,price,discount', cursor='', page_size=3)
+        self.assertEqual(set(results[0]), {'pk', 'price', 'discount'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"description"', queries[0])
+        self.assertNotIn('"preview"', queries[0])
+
+    def test_exclude_defers_columns(self):
+        results, queries = self.get(exclude='description,preview_srcset')
+        self.assertNotIn('description', results[0])
+        self.assertIn('preview', results[0])
+        self.assertNotIn('"shopapp_product"."description"', ''.join(queries))
+
+    def test_unknown_field(self):
+        with translation.override('en'):
+            url = reverse('shopapp:products-list')
+        response = self.client.get(url, {'exclude': 'secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ValuesSerializerTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def render_both(self, path: str) -> tuple[bytes, bytes]:
+        context = {'request': Request(RequestFactory().get(path))}
+        queryset = Product.objects.order_by('pk')
+        serializer = ValuesSerializer(ProductSerializer, context=context)
+        return (
+            JSONRenderer().render(ProductSerializer(queryset, many=True, context=context).data),
+            JSONRenderer().render(serializer.serialize(serializer.values_list(queryset))),
+        )
+
+    def test_output_is_identical_to_model_serializer(self):
+        Product.objects.create(name='With preview', price=Decimal('10.5'), preview='product/1/preview/a b.jpg')
+        Product.objects.create(name='Rounded', price=Decimal('0.10'), discount=5)
+        model_json, values_json = self.render_both('/api/products/')
+        self.assertEqual(model_json, values_json)
+        self.assertIn(b'"http://testserver/media/product/1/preview/a%20b.jpg"', values_json)
+
+        model_json, values_json = self.render_both('/api/products/?exclude=description,preview')
+        self.assertEqual(model_json, values_json)
+        self.assertNotIn(b'"description"', values_json)
+
+    def test_benchmark_reports_identical_output(self):
+        results = benchmark_serializers(rows=10, repeat=1)
+        self.assertTrue(results['identical'])
+        self.assertGreater(results['values_serializer_rows_per_s'], 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.product = Product.objects.get(pk=3)
+        with translation.override('en'):
+            self.urls = {
+                'detail': reverse('shopapp:product_detail', kwargs={'pk': self.product.pk}),
+                'list': reverse('shopapp:products_list'),
+                'api_list': reverse('shopapp:products-list'),
+                'api_detail': reverse('shopapp:products-detail', kwargs={'pk': self.product.pk}),
+                'csv': reverse('shopapp:products-download-csv'),
+            }
+
+    def assertRevalidates(self, name: str) -> str:
+        response = self.client.get(self.urls[name], HTTP_USER_AGENT='Mozilla/5.0')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with query_budget(1):
+            response = self.client.get(self.urls[name], HTTP_USER_AGENT='Mozilla/5.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_unchanged_resources_return_304(self):
+        for name in self.urls:
+            with self.subTest(name):
+                self.assertRevalidates(name)
+
+    def test_queryset_update_changes_validators(self):
+        etags = {name: self.assertRevalidates(name) for name in self.urls}
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.update(discount=5)
+        for name in self.urls:
+            with self.subTest(name):
+                self.assertNotEqual(self.assertRevalidates(name), etags[name])
+
+        response = self.client.get(self.urls['api_list'], HTTP_IF_NONE_MATCH=etags['api_list'])
+        self.assertEqual({product['discount'] for product in response.json()['results']}, {5})
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.urls['csv'])
+        response = self.client.get(self.urls['csv'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_image_and_bulk_changes_touch_updated_at(self):
+        before = self.product.updated_at
+        ProductImage.objects.create(product=self.product, image='product/3/images/a.jpg')
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+
+        before = self.product.updated_at
+        self.product.discount = 7
+        Product.objects.bulk_update([self.product], ['discount'])
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductDetailCacheTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.product = Product.objects.get(pk=3)
+        with translation.override('en'):
+            self.page_url = reverse('shopapp:product_detail', kwargs={'pk': self.product.pk})
+            self.api_url = reverse('shopapp:products-detail', kwargs={'pk': self.product.pk})
+            self.missing_url = reverse('shopapp:product_detail', kwargs={'pk': 999})
+
+    def test_hot_product_is_served_without_queries(self):
+        with query_budget(2):
+            self.assertContains(self.client.get(self.page_url), 'Laptop')
+        self.client.get(self.api_url)
+        with query_budget(0):
+            self.assertContains(self.client.get(self.page_url), 'Laptop')
+            self.assertEqual(self.client.get(self.api_url).json()['name'], 'Laptop')
+
+    def test_api_retrieve_uses_viewset_queryset(self):
+        self.assertContains(self.client.get(self.page_url), 'Laptop')
+        with patch.object(ProductViewSet, 'queryset', Product.objects.filter(archived=True)):
+            self.assertEqual(self.client.get(self.api_url).status_code, 404)
+        self.assertEqual(self.client.get(self.api_url).json()['name'], 'Laptop')
+
+    def test_missing_product_is_cached_briefly(self):
+        self.assertEqual(self.client.get(self.missing_url).status_code, 404)
+        with query_budget(0):
+            self.assertEqual(self.client.get(self.missing_url).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(pk=999, name='New')
+        self.assertContains(self.client.get(self.missing_url), 'New')
+
+    def test_changes_invalidate_cached_product(self):
+        self.client.get(self.page_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed laptop'
+            self.product.save()
+        self.assertContains(self.client.get(self.page_url), 'Renamed laptop')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image='product/3/images/a.jpg', description='Side view')
+        self.assertContains(self.client.get(self.page_url), 'Side view')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(price=Decimal('1.50'))
+        self.assertEqual(self.client.get(self.api_url).json()['price'], '1.50')
+
+    def test_read_before_concurrent_commit_is_not_kept(self):
+        first = ProductQuerySet.first
+
+        def first_then_update(queryset):
+            # Товар прочитан до коммита другого воркера, а в кэш
+            # попадает уже после его on_commit.
+            product = first(queryset)
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.filter(pk=self.product.pk).update(name='Renamed laptop')
+            return product
+
+        with patch.object(ProductQuerySet, 'first', first_then_update):
+            self.assertEqual(get_product_detail(Product.objects.all(), self.product.pk).name, 'Laptop')
+        self.assertContains(self.client.get(self.page_url), 'Renamed laptop')
+
+    def test_bump_does_not_derive_version_from_the_old_one(self):
+        # Версию v + 1 мог записать и другой воркер, прочитавший ту же v.
+        version = get_products_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_products_version()
+        self.assertNotIn(get_products_version(), (version, version + 1))
+
+    def test_bulk_changes_bump_details_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.bulk_create(
+                Product(name=f'Bulk {i}') for i in range(PRODUCT_DETAILS_BUMP_LIMIT + 1)
+            )
+        self.assertContains(self.client.get(self.page_url), 'Laptop')
+
+        # pk всех товаров не читаются: хватает лимита + 1.
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            Product.objects.update(name='Renamed')
+        self.assertIn(f'LIMIT {PRODUCT_DETAILS_BUMP_LIMIT + 1}', queries[0]['sql'])
+        self.assertContains(self.client.get(self.page_url), 'Renamed')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TemplateFragmentCacheTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create_user(username='bob_test', first_name='Bob')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def render_products(self) -> str:
+        products = list(Product.objects.filter(archived=False).order_by('pk'))
+        with translation.override('en'):
+            return render_to_string('shopapp/products-list.html', {'products': products}, request=self.request)
+
+    def render_orders(self) -> str:
+        orders = list(Order.objects.select_related('user').prefetch_related('products'))
+        with translation.override('en'):
+            return render_to_string('shopapp/order_list.html', {'object_list': orders}, request=self.request)
+
+    def test_product_card_follows_updated_at(self):
+        product = Product.objects.get(pk=3)
+        self.assertIn('Laptop', self.render_products())
+
+        # Без смены updated_at берется карточка из кэша.
+        Product.objects.filter(pk=product.pk).update(name='Stale laptop', updated_at=product.updated_at)
+        self.assertNotIn('Stale laptop', self.render_products())
+
+        Product.objects.filter(pk=product.pk).update(name='Fresh laptop')
+        self.assertIn('Fresh laptop', self.render_products())
+
+    def test_order_card_keeps_customer_name_fresh(self):
+        order = Order.objects.create(user=self.user, delivery_address='ul Mira, d 1')
+        html = self.render_orders()
+        self.assertLess(html.index('Detail #'), html.index('Order by Bob'))
+        self.assertLess(html.index('Order by Bob'), html.index('Promocode'))
+
+        User.objects.filter(pk=self.user.pk).update(first_name='Robert')
+        Order.objects.filter(pk=order.pk).update(delivery_address='ul Lenina, d 2', updated_at=order.updated_at)
+        html = self.render_orders()
+        self.assertIn('Robert', html)
+        self.assertIn('ul Mira, d 1', html)
+
+        Order.objects.filter(pk=order.pk).update(delivery_address='ul Lenina, d 2')
+        self.assertIn('ul Lenina, d 2', self.render_orders())
+
+    def test_benchmark_reports_cold_and_warm_renders(self):
+        User.objects.create_superuser(username='benchmark_admin')
+        results = benchmark_templates(items=10, repeat=1)
+        self.assertIn('shopapp/products-list.html', results)
+        for result in results.values():
+            self.assertGreater(result['cold_ms_per_1000'], 0)
+            self.assertGreater(result['warm_ms_per_1000'], 0)
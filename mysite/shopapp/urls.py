@@ -18,12 +18,14 @@ from .views import (
     ProductDeleteView,
     ProductsDataExportView,
     ProductViewSet,
+    OrderViewSet,
 )
 
 app_name = "shopapp"
 
 routers = DefaultRouter()
 routers.register('products', ProductViewSet, basename='products')
+routers.register('orders', OrderViewSet, basename='orders')
 
 urlpatterns = [
     path("", ShopIndexView.as_view(), name="index"),
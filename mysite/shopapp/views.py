@@ -3,34 +3,48 @@
 
 Разные view интернет-магазина: по товарам, заказам, и т.д.
 """
-from csv import DictWriter
 from dataclasses import field
 from timeit import default_timer
+import json
 import logging
+from hashlib import md5
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
-from django.contrib.auth.models import Group
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.contrib.auth.models import Group, Permission
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
 from django.core.cache import cache
-from django.utils.decorators import method_decorator
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.views.decorators.cache import cache_page
 from django.views import View
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from docutils.parsers.rst.directives import encoding
+from rest_framework import status
 from rest_framework.parsers import MultiPartParser
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiResponse
+from mysite.conditional import Validators, conditional_response, set_validators
+from requestdataapp.querycheck import query_budget
 
-from .common import save_csv_products
+from .caching import aget_product_detail, aproducts_cache_key, get_product_detail, PRODUCTS_CACHE_TIMEOUT
+from .conditional import aproduct_validators, instance_validators, product_validators
+from .common import save_csv_products, stream_csv, CSV_EXPORT_CHUNK_SIZE
 from .forms import ProductForm, GroupForm
 from .models import Product, Order, ProductImage
-from .serializers import ProductSerializer
+from .pagination import KeysetPagination
+from .search import ProductSearchFilter
+from .serializers import OrderProductSerializer, OrderSerializer, ProductSerializer, ValuesSerializer, model_columns
 
 log = logging.getLogger(__name__)
 
@@ -39,11 +53,14 @@ class ProductViewSet(ModelViewSet):
     """
     Набор представлений для действий над Product
     Полный набор CRUD для сущностей товара
+
+    ``?fields=pk,price`` и ``?exclude=description`` сужают ответ
+    и список выбираемых из базы столбцов.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = (
-        SearchFilter,
+        ProductSearchFilter,
         DjangoFilterBackend,
         OrderingFilter
     )
@@ -60,35 +77,87 @@ class ProductViewSet(ModelViewSet):
         'price',
         'discount',
     ]
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        # ?fields= / ?exclude= сужают и выборку; столбцы порядка
+        # остаются - по ним keyset-пагинация строит курсор.
+        ordering = [
+            name for name in self.ordering_columns(queryset)
+            if name not in queryset.query.annotations
+        ]
+        return ProductSerializer.narrow_queryset(queryset, self.request, keep=ordering)
+
+    @staticmethod
+    def ordering_columns(queryset) -> list[str]:
+        return [
+            term.lstrip('-') for term in (queryset.query.order_by or Product._meta.ordering)
+            if isinstance(term, str)
+        ]
+
+    @property
+    def paginator(self):
+        # ?cursor= (в том числе пустой) включает keyset-пагинацию
+        # вместо постраничной, без COUNT(*) и OFFSET.
+        if not hasattr(self, '_paginator') and KeysetPagination.cursor_query_param in self.request.query_params:
+            self._paginator = KeysetPagination()
+        return super().paginator
+
     @action(methods=['GET'], detail=False)
     def download_csv(self, request: Request):
-
-        response = HttpResponse(content_type='text/csv')
-        filename ="products-export.csv"
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        queryset = self.filter_queryset(self.get_queryset())
         fields = [
             'name',
             'description',
             'price',
             'discount',
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = product_validators(queryset, 'csv')
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+        rows = (
+            queryset
+            .values_list(*fields)
+            .iterator(chunk_size=CSV_EXPORT_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse(
+            stream_csv(fields, rows),
+            content_type='text/csv',
+        )
+        filename = "products-export.csv"
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return set_validators(response, validators)
 
-        return response
+    def get_validators(self, queryset) -> Validators:
+        # JSON и browsable API по одному URL - разные представления.
+        return product_validators(queryset, self.request.accepted_renderer.format)
 
-    @method_decorator(cache_page(60 * 2))
-    def list(self, *args, **kwargs):
+    def list(self, request: Request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = self.get_validators(queryset)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+        # ETag входит в ключ кэша: после изменения товаров старый ответ
+        # больше не читается, а не живет до конца таймаута.
+        cached_list = cache_page(60 * 2, key_prefix=validators.etag.strip('"'))(self.list_page)
+        return cached_list(request, queryset, validators)
+
+    def list_page(self, request: Request, queryset, validators: Validators):
         #print('hello products list')
-        return super().list(*args, **kwargs)
+        # Быстрый путь: строки из values_list() без экземпляров модели,
+        # ответ тот же, что у ProductSerializer.
+        serializer = ValuesSerializer(ProductSerializer, context=self.get_serializer_context())
+        rows = serializer.values_list(queryset, extra=self.ordering_columns(queryset))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            response = self.get_paginated_response(serializer.serialize(page))
+        else:
+            response = Response(serializer.serialize(rows))
+        return set_validators(response, validators)
 
     @action(
         detail=False,
@@ -96,12 +165,15 @@ class ProductViewSet(ModelViewSet):
         parser_classes=(MultiPartParser,)
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
-            request.FILES['products'].file,
-            encoding = request.encoding,
-        )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        try:
+            result = save_csv_products(
+                request.FILES['products'].file,
+                encoding=request.encoding,
+                upsert=request.query_params.get('upsert') in ('1', 'true'),
+            )
+        except ValidationError as exc:
+            return Response({'detail': exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict())
 
     @extend_schema(
         summary="Get one product by ID",
@@ -111,11 +183,78 @@ class ProductViewSet(ModelViewSet):
         400: OpenApiResponse(description='Empty response, product by id not found'),
         }
     )
+    def retrieve(self, request: Request, *args, **kwargs):
+        # Товар берется из кэша отдельных товаров, а валидаторы
+        # считаются по нему же: горячий товар отдается без базы.
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        product = get_product_detail(self.filter_queryset(self.get_queryset()), pk)
+        if product is None:
+            raise Http404
+        self.check_object_permissions(request, product)
+        validators = instance_validators(product, request.accepted_renderer.format)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(Response(self.get_serializer(product).data), validators)
+
+
+
+@extend_schema(description="Orders read-only API")
+class OrderViewSet(ReadOnlyModelViewSet):
+    """
+    Заказы только для чтения: новые первыми, keyset-пагинация.
+
+    Фильтры: ``?user=``, ``?created_at__gte=``, ``?created_at__lt=``,
+    ``?created_at__date=``. ``?fields=pk,total`` (или ``?exclude=``)
+    сужает и ответ, и выборку: из базы читаются только столбцы
+    запрошенных полей, а пользователь и товары подгружаются, только
+    если их запросили.
+    Без права ``shopapp.view_order`` видны только свои заказы.
+    """
+    serializer_class = OrderSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_fields = {
+        'user': ['exact'],
+        'created_at': ['gte', 'lt', 'date'],
+    }
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # Генерация схемы drf-spectacular: запроса пользователя нет.
+            return Order.objects.none()
+        fields = OrderSerializer.requested_fields(self.request)
+        queryset = Order.objects.order_by('-created_at', '-pk')
+        if not self.request.user.has_perm('shopapp.view_order'):
+            queryset = queryset.filter(user=self.request.user)
+
+        # created_at нужен курсору пагинации в любом случае.
+        columns = model_columns(OrderSerializer, ['pk', 'created_at', *fields])
+        if 'user' in fields:
+            queryset = queryset.select_related('user')
+            columns += ['user__id', 'user__username']
+        if 'products' in fields:
+            products = Product.objects.only(
+                *model_columns(OrderProductSerializer, OrderProductSerializer.Meta.fields),
+            )
+            queryset = queryset.prefetch_related(Prefetch('products', queryset=products))
+        return queryset.only(*columns)
+
+    # Запросы: права пользователя (два, если он не суперпользователь),
+    # проверка ?user=, заказы и товары заказов.
+    @query_budget(5)
+    def list(self, *args, **kwargs):
+        return super().list(*args, **kwargs)
+
+    @query_budget(4)
     def retrieve(self, *args, **kwargs):
         return super().retrieve(*args, **kwargs)
 
 
-
 # Create your views here.
 class ShopIndexView(View):
 
@@ -151,10 +290,14 @@ class ShopIndexView(View):
 #     return render(request, 'shopapp/shop-index.html', context=context)
 
 class GroupsListView(View):
+    @query_budget(4)
     def get(self, request: HttpRequest) -> HttpResponse:
         context = {
             "form": GroupForm(),
-            "groups": Group.objects.prefetch_related('permissions').all,
+            # str(permission) обращается к content_type.
+            "groups": Group.objects.prefetch_related(
+                Prefetch('permissions', queryset=Permission.objects.select_related('content_type')),
+            ),
         }
         return render(request, 'shopapp/groups-list.html', context=context)
 
@@ -173,11 +316,28 @@ class GroupsListView(View):
 #         }
 #         return render(request, 'shopapp/products-details.html', context=context)
 
-class ProductDetailView(DetailView):
+class ProductDetailView(View):
+    """
+    Асинхронная страница товара: запрос идет через async ORM,
+    и воркер ASGI не блокируется на ожидании базы. Товар с картинками
+    берется из кэша отдельных товаров (shopapp.caching).
+    """
     template_name = 'shopapp/products-details.html'
-    #model = Product
     queryset = Product.objects.prefetch_related('images')
-    context_object_name = 'product'
+
+    @query_budget(2)
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        product = await aget_product_detail(self.queryset, pk)
+        if product is None:
+            raise Http404('No Product matches the given query.')
+        validators = instance_validators(product)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+        # Шаблон читает файловый кэш ({% cache %}, responsive_image),
+        # поэтому рендерим вне цикла событий.
+        response = await sync_to_async(render)(request, self.template_name, context={'product': product})
+        return set_validators(response, validators)
 
 #def groups_list(request: HttpRequest):
 #     context = {
@@ -193,12 +353,19 @@ class ProductDetailView(DetailView):
 #         context['products'] = Product.objects.all()
 #         return context
 
-class ProductListView(ListView):
+class ProductListView(View):
     template_name = 'shopapp/products-list.html'
-    #model = Product
-    context_object_name = 'products'
     queryset = Product.objects.filter(archived=False)
 
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        validators = await aproduct_validators(self.queryset)
+        not_modified = conditional_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+        products = [product async for product in self.queryset.all()]
+        response = await sync_to_async(render)(request, self.template_name, context={'products': products})
+        return set_validators(response, validators)
+
 
 class ProductCreateView(CreateView):#UserPassesTestMixin,# CreateView):
     def test_func(self):
@@ -280,6 +447,10 @@ class OrderListView(LoginRequiredMixin, ListView):
         .prefetch_related('products')
     )
 
+    @query_budget(2)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class OrderDetailView(PermissionRequiredMixin, DetailView):
     permission_required = 'shopapp.view_order'
@@ -289,23 +460,36 @@ class OrderDetailView(PermissionRequiredMixin, DetailView):
         .prefetch_related('products')
     )
 
+    @query_budget(2)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class ProductsDataExportView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key = 'product_data_export'
-        products_data = cache.get(cache_key)
-        if products_data is None:
-            products = Product.objects.order_by('pk').all()
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        cache_key = await aproducts_cache_key('data_export')
+        cached = await cache.aget(cache_key)
+        if cached is None:
+            products = Product.objects.order_by('pk').values_list('pk', 'name', 'price', 'archived')
             products_data = [
                 {
-                    'pk': product.pk,
-                    'name': product.name,
-                    'price': product.price,
-                    'archived': product.archived,
+                    'pk': pk,
+                    'name': name,
+                    'price': price,
+                    'archived': archived,
                 }
-                for product in products
+                async for pk, name, price, archived in products
             ]
-        cache.set(cache_key, products_data, 300)
-        elem = products_data[0]
-        name = elem["name"]
-        print('name:', name)
-        return JsonResponse({'products': products_data})
\ No newline at end of file
+            cached = await sync_to_async(self.encode)(products_data)
+            await cache.aset(cache_key, cached, PRODUCTS_CACHE_TIMEOUT)
+
+        etag, content = cached
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return get_conditional_response(request, etag=etag, response=response)
+
+    @staticmethod
+    def encode(products_data: list[dict]) -> tuple[str, bytes]:
+        # Сериализация всего каталога занимает заметное время, ее
+        # выполняем в потоке, а не в цикле событий.
+        content = json.dumps({'products': products_data}, cls=DjangoJSONEncoder).encode()
+        return quote_etag(md5(content).hexdigest()), content